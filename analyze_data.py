@@ -1,55 +1,107 @@
 import os
 
 # Set explicit paths to Tcl and Tk libraries - (delete later)
-os.add_dll_directory(r"C:\Program Files\PostgreSQL\17\bin")
-os.environ["TCL_LIBRARY"] = (
-    r"C:\Users\grass\AppData\Local\Programs\Python\Python313\tcl\tcl8.6"
-)
-os.environ["TK_LIBRARY"] = (
-    r"C:\Users\grass\AppData\Local\Programs\Python\Python313\tcl\tk8.6"
-)
-
-import matplotlib.pyplot as plt
+if os.name == "nt":
+    os.add_dll_directory(r"C:\Program Files\PostgreSQL\17\bin")
+    os.environ["TCL_LIBRARY"] = (
+        r"C:\Users\grass\AppData\Local\Programs\Python\Python313\tcl\tcl8.6"
+    )
+    os.environ["TK_LIBRARY"] = (
+        r"C:\Users\grass\AppData\Local\Programs\Python\Python313\tcl\tk8.6"
+    )
+
+import itertools
+import threading
+import time
 import pandas as pd
 import psycopg2
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+# matplotlib.pyplot is only imported by the plot functions, as it takes longer to import than everything else
 
-class DBConfig:
-    HOST = "localhost"
-    PORT = "5432"
-    DB_NAME = "olympic_games_history"
-    USERNAME = "postgres"
-    PASSWORD = "XXXXX"
+import estimators
+from database import POOL_SIZE, ConnectionPool
+import tracing
+from query_cache import cached_query
 
+# Whether `get_table_with_calculated_age` aggregates the ages in the database or in pandas
+AGE_AGGREGATION_ON_SERVER = True
 
-# connect to DB
-def connect_to_db(config_params):
-    return psycopg2.connect(
-        host=config_params.HOST,
-        port=config_params.PORT,
-        dbname=config_params.DB_NAME,
-        user=config_params.USERNAME,
-        password=config_params.PASSWORD,
-    )
+# Whether `get_table_with_calculated_age` plots the estimates of `estimate_average_ages` instead of the exact
+# values, see estimators.py
+APPROXIMATE = False
 
+# Values of GROUPING(season, medal, gender) for the grouping sets of `query_average_ages`
+AGE_GROUPING_SETS = {"medal": 0b001, "gender": 0b010, "year_gender": 0b110}
 
-# function for plotting
-def get_country_medals_over_time(conn):
+# Column types of the tables returned by `read_query`, all other columns are text
+COLUMN_DTYPES = {
+    "result_id": "Int64",
+    "athlete_id": "Int64",
+    "game_id": "Int64",
+    "event_id": "Int64",
+    "sport_id": "Int64",
+    "year": "Int16",
+    "height": "float64",
+    "weight": "float64",
+    "age_at_game": "float64",
+    "was_held": "boolean",
+    "is_team_event": "boolean",
+}
+DATE_COLUMNS = ["date_of_birth", "start_date", "end_date", "effective_start_date"]
+
+# Whether `read_query` and `compute_average_ages` return their DataFrames with the types of `compact_dtypes`
+COMPACT_DTYPES = True
+
+# Text columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+# Rows per DataFrame yielded by `iter_query`
+BATCH_SIZE = 50_000
+
+# Names of the server-side cursors of `iter_query`, unique per connection
+CURSOR_IDS = itertools.count()
+
+
+def read_sql(query: str, conn) -> pd.DataFrame:
+    """
+    `pd.read_sql_query` behind the on-disk query cache, see query_cache.py, in a "query" span of the trace.
+    """
+
+    with tracing.query_span(conn, query, "read_sql") as record:
+        df = cached_query(conn, query, lambda: pd.read_sql_query(query, conn), reader="read_sql")
+        record["rows_out"] = len(df)
+    return df
+
+
+@tracing.traced("analysis")
+def query_country_medals(conn) -> pd.DataFrame:
+    """
+    Returns the number of medals won by every country per year.
+
+    Args:
+    - conn: Database connection object.
+    """
+
+    # medals per country and game are precomputed in the country_medals materialized view
     query = """
     SELECT
-        c.name AS country,
-        g.year,
-        COUNT(r.result_id) AS total_medals
-    FROM result r
-    JOIN game g ON r.game_id = g.game_id
-    JOIN athlete a ON r.athlete_id = a.athlete_id
-    JOIN country c ON a.country_id = c.country_id
-    WHERE r.position IN ('1', '2', '3')
-    GROUP BY c.name, g.year
-    ORDER BY g.year, total_medals DESC;
+        country,
+        year,
+        SUM(total_medals)::BIGINT AS total_medals
+    FROM country_medals
+    GROUP BY country, year
+    ORDER BY year, total_medals DESC;
     """
 
-    df_medals = pd.read_sql_query(query, conn)
+    return read_sql(query, conn)
+
+
+# function for plotting
+@tracing.traced("plot")
+def plot_country_medals(df_medals: pd.DataFrame):
+    import matplotlib.pyplot as plt
+
     print(df_medals.head())
     print(df_medals[df_medals["year"] == 2022])
     plt.plot(df_medals["country"][0], df_medals["total_medals"][0])
@@ -68,43 +120,159 @@ def get_country_medals_over_time(conn):
     """
 
 
-def get_table_with_calculated_age(conn):
+@tracing.traced("analysis")
+def get_country_medals_over_time(conn):
+    plot_country_medals(query_country_medals(conn))
+
+
+@tracing.traced("analysis")
+def query_average_ages(conn) -> pd.DataFrame:
     """
-    Returns a pandas DataFrame with calculated ages of the athletes.
-    When the start_date is missing, 01-01-XXXX or 07.01.XXXX (MM-DD-YYYY) is taken for calculation for
-    winter/summer games.
+    Returns the average ages of the athletes per year of the game, aggregated on the server by a single
+    GROUPING SETS query. Only a few rows per game are sent to the client instead of every result. The ages
+    are the age_at_game column of the result table, filled by the load, see derive_columns.sql.
 
-     Args:
+    The `grouping_set` column tells which of the `AGE_GROUPING_SETS` a row belongs to, `avg_age` is the
+    average over all athletes of the group and `medalist_avg_age` the average over its medalists only.
+
+    Args:
     - conn: Database connection object.
     """
 
     query = """
-    SELECT a.date_of_birth, a.name, a.gender, r.position, game.title,
-	AGE(
-		CASE
-            WHEN game.start_date IS NOT NULL THEN game.start_date 
-			WHEN game.title ILIKE '%Wint%' THEN TO_DATE(game.year || '-01-01', 'YYYY-MM-DD') 
-        	WHEN game.title ILIKE '%Sum%' THEN TO_DATE(game.year || '-07-01', 'YYYY-MM-DD')
-            ELSE NULL END,
-			a.date_of_birth
-    ) AS age
-	FROM athlete AS a
-	INNER JOIN result AS r ON a.athlete_id = r.athlete_id
-	INNER JOIN game ON r.game_id = game.game_id
-    """
-
-    # creating a pandas DataFrame from SQL query above and doing some preprocessing
-    df_athletes = pd.read_sql_query(query, conn)
-    df_athletes = df_athletes.dropna(subset=["age"])  # drop rows without age
-    df_athletes["year"] = (
-        df_athletes["title"].str.extract(r"(\d{4})").astype(int)
-    )  # create column for year from game title
-    df_athletes["game_season"] = df_athletes["title"].str.extract(
-        r"(Summer|Winter)"
-    )  # create column for winter / summer
-    df_athletes["age"] = (
-        df_athletes["age"].dt.days / 365
-    )  # format age column from days to years
+    WITH athlete_age AS (
+        SELECT
+            game.year,
+            game.season,
+            CASE WHEN r.position IN ('1', '2', '3') THEN r.position END AS medal,
+            a.gender,
+            r.age_at_game AS age
+        FROM athlete AS a
+        INNER JOIN result AS r ON a.athlete_id = r.athlete_id
+        INNER JOIN game ON r.game_id = game.game_id
+        WHERE r.age_at_game IS NOT NULL
+    )
+    SELECT
+        GROUPING(season, medal, gender) AS grouping_set,
+        year, season, medal, gender,
+        AVG(age) AS avg_age,
+        AVG(age) FILTER (WHERE medal IS NOT NULL) AS medalist_avg_age
+    FROM athlete_age
+    GROUP BY GROUPING SETS ((year, season, medal), (year, season, gender), (year, gender))
+    ORDER BY grouping_set, year;
+    """
+
+    return read_sql(query, conn)
+
+
+def split_average_ages(df_ages: pd.DataFrame) -> dict:
+    """
+    Splits the rows of `query_average_ages` into the series plotted by `plot_average_ages`, in the same
+    format as `compute_average_ages`.
+
+    Args:
+    - df_ages: DataFrame returned by `query_average_ages`.
+    """
+
+    def select(grouping_set, value_column, name, **filters):
+        rows = df_ages["grouping_set"] == AGE_GROUPING_SETS[grouping_set]
+        for column, value in filters.items():
+            rows &= df_ages[column] == value
+        return (
+            df_ages.loc[rows & df_ages[value_column].notna(), ["year", value_column]]
+            .rename(columns={value_column: name})
+            .sort_values("year")
+            .reset_index(drop=True)
+        )
+
+    average_ages = {}
+    for season in ["Summer", "Winter"]:
+        for medal, medal_name in [("1", "gold"), ("2", "silver"), ("3", "bronze")]:
+            average_ages[f"{medal_name}_{season.lower()}"] = select(
+                "medal", "avg_age", f"{medal_name}_avg_age", season=season, medal=medal
+            )
+        for gender in ["Male", "Female"]:
+            average_ages[f"{gender.lower()}_medalist_{season.lower()}"] = select(
+                "gender", "medalist_avg_age", f"{gender.lower()}_avg_age", season=season, gender=gender
+            )
+    for gender in ["Male", "Female"]:
+        average_ages[gender.lower()] = select(
+            "year_gender", "avg_age", f"{gender.lower()}_avg_age", gender=gender
+        )
+
+    return average_ages
+
+
+@tracing.traced("analysis")
+def estimate_average_ages(conn) -> pd.DataFrame:
+    """
+    Approximate version of `query_average_ages` from the stratified sample of the age_sample view, which
+    holds at most a few hundred results per year, season and medal however big the result table is. Returns
+    the same rows with the error bounds of the averages in avg_age_error and medalist_avg_age_error, see
+    `estimators.estimate_means`.
+
+    Args:
+    - conn: Database connection object.
+    """
+
+    df_sample = read_sql("SELECT year, season, medal, gender, age, stratum_rows FROM age_sample", conn)
+    if COMPACT_DTYPES:
+        df_sample = compact_dtypes(df_sample)
+    strata = ["year", "season", "medal"]
+    groups = {
+        "medal": ["year", "season", "medal"],
+        "gender": ["year", "season", "gender"],
+        "year_gender": ["year", "gender"],
+    }
+
+    df_sets = []
+    for grouping_set, by in groups.items():
+        df_all = estimators.estimate_means(df_sample, by, "age", strata)
+        # the medal strata are whole strata of the sample
+        df_medalists = estimators.estimate_means(
+            df_sample[df_sample["medal"].notna()], by, "age", strata
+        )
+        df_set = df_all.rename(columns={"mean": "avg_age", "error": "avg_age_error"}).merge(
+            df_medalists.rename(columns={"mean": "medalist_avg_age", "error": "medalist_avg_age_error"}),
+            on=by,
+            how="left",
+        )
+        df_set["grouping_set"] = AGE_GROUPING_SETS[grouping_set]
+        df_sets.append(df_set)
+
+    columns = ["grouping_set", "year", "season", "medal", "gender", "avg_age", "medalist_avg_age"]
+    df_ages = pd.concat(df_sets, ignore_index=True).reindex(
+        columns=columns + ["avg_age_error", "medalist_avg_age_error"]
+    )
+    return df_ages.sort_values(["grouping_set", "year"], kind="stable").reset_index(drop=True)
+
+
+# Every athlete result with a known age of the athlete at the game, with the season and age columns the load
+# derived from the game and the birth date, see derive_columns.sql
+ATHLETE_AGE_QUERY = """
+    SELECT a.date_of_birth, a.name, a.gender, r.position, game.title, game.year,
+    game.season AS game_season, r.age_at_game AS age
+    FROM athlete AS a
+    INNER JOIN result AS r ON a.athlete_id = r.athlete_id
+    INNER JOIN game ON r.game_id = game.game_id
+    WHERE r.age_at_game IS NOT NULL
+"""
+
+
+@tracing.traced("analysis")
+def compute_average_ages(conn) -> tuple:
+    """
+    Client side version of `query_average_ages` and `split_average_ages`: pulls every athlete result with
+    the age of the athlete and computes the averages with pandas. Returns the full DataFrame and the series.
+
+     Args:
+    - conn: Database connection object.
+    """
+
+    # creating a pandas DataFrame from `ATHLETE_AGE_QUERY`
+    df_athletes = read_sql(ATHLETE_AGE_QUERY, conn)
+    if COMPACT_DTYPES:
+        df_athletes = compact_dtypes(df_athletes)
 
     # creating some filters for position, winter/summer games and gender:
     gold_medalist = df_athletes["position"] == "1"
@@ -160,6 +328,106 @@ def get_table_with_calculated_age(conn):
         .reset_index(name="bronze_avg_age")
     )
 
+    # Creating dfs for plotting:
+    male_medalist_summer_avg_age = (
+        df_athletes[
+            (gold_medalist | silver_medalist | bronze_medalist)
+            & summer_games
+            & filter_male
+        ]
+        .groupby("year")["age"]
+        .mean()
+        .reset_index(name="male_avg_age")
+    )
+
+    male_medalist_winter_avg_age = (
+        df_athletes[
+            (gold_medalist | silver_medalist | bronze_medalist)
+            & winter_games
+            & filter_male
+        ]
+        .groupby("year")["age"]
+        .mean()
+        .reset_index(name="male_avg_age")
+    )
+
+    female_medalist_summer_avg_age = (
+        df_athletes[
+            (gold_medalist | silver_medalist | bronze_medalist)
+            & summer_games
+            & filter_female
+        ]
+        .groupby("year")["age"]
+        .mean()
+        .reset_index(name="female_avg_age")
+    )
+
+    female_medalist_winter_avg_age = (
+        df_athletes[
+            (gold_medalist | silver_medalist | bronze_medalist)
+            & winter_games
+            & filter_female
+        ]
+        .groupby("year")["age"]
+        .mean()
+        .reset_index(name="female_avg_age")
+    )
+
+    # Creating the df´s for all participants in a specific game and calculating the average age
+    male_avg_age = (
+        df_athletes[filter_male]
+        .groupby("year")["age"]
+        .mean()
+        .reset_index(name="male_avg_age")
+    )
+    female_avg_age = (
+        df_athletes[filter_female]
+        .groupby("year")["age"]
+        .mean()
+        .reset_index(name="female_avg_age")
+    )
+
+    average_ages = {
+        "gold_summer": av_age_gold_medalists_summer_all,
+        "silver_summer": av_age_silver_medalists_summer_all,
+        "bronze_summer": av_age_bronze_medalists_summer_all,
+        "gold_winter": av_age_gold_medalists_winter_all,
+        "silver_winter": av_age_silver_medalists_winter_all,
+        "bronze_winter": av_age_bronze_medalists_winter_all,
+        "male_medalist_summer": male_medalist_summer_avg_age,
+        "male_medalist_winter": male_medalist_winter_avg_age,
+        "female_medalist_summer": female_medalist_summer_avg_age,
+        "female_medalist_winter": female_medalist_winter_avg_age,
+        "male": male_avg_age,
+        "female": female_avg_age,
+    }
+    return df_athletes, average_ages
+
+
+@tracing.traced("plot")
+def plot_average_ages(average_ages: dict):
+    """
+    Plots the average ages of medalists and of male and female athletes over time.
+
+    Args:
+    - average_ages: Series returned by `split_average_ages` or `compute_average_ages`.
+    """
+
+    import matplotlib.pyplot as plt
+
+    av_age_gold_medalists_summer_all = average_ages["gold_summer"]
+    av_age_silver_medalists_summer_all = average_ages["silver_summer"]
+    av_age_bronze_medalists_summer_all = average_ages["bronze_summer"]
+    av_age_gold_medalists_winter_all = average_ages["gold_winter"]
+    av_age_silver_medalists_winter_all = average_ages["silver_winter"]
+    av_age_bronze_medalists_winter_all = average_ages["bronze_winter"]
+    male_medalist_summer_avg_age = average_ages["male_medalist_summer"]
+    male_medalist_winter_avg_age = average_ages["male_medalist_winter"]
+    female_medalist_summer_avg_age = average_ages["female_medalist_summer"]
+    female_medalist_winter_avg_age = average_ages["female_medalist_winter"]
+    male_avg_age = average_ages["male"]
+    female_avg_age = average_ages["female"]
+
     # --------------------------------------------------------------------------------------#
     # ----- Plot Average Age of Medal Winners of Summer Games (1896-2020 All Genders) ------#
     # --------------------------------------------------------------------------------------#
@@ -232,51 +500,6 @@ def get_table_with_calculated_age(conn):
     # -- Male and Female Medalists AV Age--#
     # -------------------------------------#
 
-    # Creating dfs for plotting:
-    male_medalist_summer_avg_age = (
-        df_athletes[
-            (gold_medalist | silver_medalist | bronze_medalist)
-            & summer_games
-            & filter_male
-        ]
-        .groupby("year")["age"]
-        .mean()
-        .reset_index(name="male_avg_age")
-    )
-
-    male_medalist_winter_avg_age = (
-        df_athletes[
-            (gold_medalist | silver_medalist | bronze_medalist)
-            & winter_games
-            & filter_male
-        ]
-        .groupby("year")["age"]
-        .mean()
-        .reset_index(name="male_avg_age")
-    )
-
-    female_medalist_summer_avg_age = (
-        df_athletes[
-            (gold_medalist | silver_medalist | bronze_medalist)
-            & summer_games
-            & filter_female
-        ]
-        .groupby("year")["age"]
-        .mean()
-        .reset_index(name="female_avg_age")
-    )
-
-    female_medalist_winter_avg_age = (
-        df_athletes[
-            (gold_medalist | silver_medalist | bronze_medalist)
-            & winter_games
-            & filter_female
-        ]
-        .groupby("year")["age"]
-        .mean()
-        .reset_index(name="female_avg_age")
-    )
-
     # plotting
     fig, axs = plt.subplots(2, 1, figsize=(12, 10), sharex=True)
     # summer games
@@ -340,19 +563,6 @@ def get_table_with_calculated_age(conn):
     # ---------- Male and Female ----------#
     # -------------------------------------#
 
-    # Creating the df´s for all participants in a specific game and calculating the average age
-    male_avg_age = (
-        df_athletes[filter_male]
-        .groupby("year")["age"]
-        .mean()
-        .reset_index(name="male_avg_age")
-    )
-    female_avg_age = (
-        df_athletes[filter_female]
-        .groupby("year")["age"]
-        .mean()
-        .reset_index(name="female_avg_age")
-    )
     # plot
     fig, ax = plt.subplots(figsize=(12, 6))
     ax.set_facecolor("green")  # background color
@@ -385,10 +595,37 @@ def get_table_with_calculated_age(conn):
     plt.tight_layout()
     plt.show()
 
-    return df_athletes
 
+@tracing.traced("analysis")
+def get_table_with_calculated_age(
+    conn, server_side=AGE_AGGREGATION_ON_SERVER, approximate=APPROXIMATE
+):
+    """
+    Plots the average ages of the athletes over time and returns the DataFrame they are computed from:
+    the aggregated rows of `query_average_ages` or, without `server_side`, every athlete result with the
+    calculated age.
 
-def get_gender_ratio_change(conn, include_dns=True):
+     Args:
+    - conn: Database connection object.
+    - server_side: Whether to aggregate the ages in the database.
+    - approximate: Whether to plot the estimates of `estimate_average_ages` instead.
+    """
+
+    if approximate:
+        df_ages = estimate_average_ages(conn)
+        average_ages = split_average_ages(df_ages)
+    elif server_side:
+        df_ages = query_average_ages(conn)
+        average_ages = split_average_ages(df_ages)
+    else:
+        df_ages, average_ages = compute_average_ages(conn)
+
+    plot_average_ages(average_ages)
+    return df_ages
+
+
+@tracing.traced("analysis")
+def query_gender_ratio(conn, include_dns=True) -> pd.DataFrame:
     """
     This function queries the count of athletes who participated in each year, and also queries the
     gender count.
@@ -398,32 +635,30 @@ def get_gender_ratio_change(conn, include_dns=True):
     - include_dns: Whether to include athletes with DNS (DID NOT START).
     """
 
+    # distinct participants per game and gender are precomputed in the game_participation materialized view,
+    # participants_started leaves out the athletes who did not start
     if include_dns:
         query = """
-        SELECT game.year, game.title, 
-        COUNT(DISTINCT athlete.athlete_id) AS total_participants,
-        COUNT(DISTINCT athlete.athlete_id) FILTER (WHERE athlete.gender = 'Male') AS male_participants,
-        COUNT(DISTINCT athlete.athlete_id) FILTER (WHERE athlete.gender = 'Female') AS female_participants
-        FROM result
-        INNER JOIN athlete ON result.athlete_id = athlete.athlete_id
-        INNER JOIN game ON result.game_id = game.game_id
-        GROUP BY game.year, game.title;
+        SELECT year, title,
+        SUM(participants)::BIGINT AS total_participants,
+        COALESCE(SUM(participants) FILTER (WHERE gender = 'Male'), 0)::BIGINT AS male_participants,
+        COALESCE(SUM(participants) FILTER (WHERE gender = 'Female'), 0)::BIGINT AS female_participants
+        FROM game_participation
+        GROUP BY year, title;
         """
     else:
         query = """
-        SELECT game.year, game.title, 
-        COUNT(DISTINCT athlete.athlete_id) AS total_participants,
-        COUNT(DISTINCT athlete.athlete_id) FILTER (WHERE athlete.gender = 'Male') AS male_participants,
-        COUNT(DISTINCT athlete.athlete_id) FILTER (WHERE athlete.gender = 'Female') AS female_participants
-        FROM result
-        INNER JOIN athlete ON result.athlete_id = athlete.athlete_id
-        INNER JOIN game ON result.game_id = game.game_id
-        WHERE NOT result.position IN ('DNS')
-        GROUP BY game.year, game.title;
+        SELECT year, title,
+        SUM(participants_started)::BIGINT AS total_participants,
+        COALESCE(SUM(participants_started) FILTER (WHERE gender = 'Male'), 0)::BIGINT AS male_participants,
+        COALESCE(SUM(participants_started) FILTER (WHERE gender = 'Female'), 0)::BIGINT AS female_participants
+        FROM game_participation
+        GROUP BY year, title
+        HAVING SUM(participants_started) > 0;
         """
 
     # creating a pandas DataFrame with the above query
-    df_count = pd.read_sql_query(query, conn)
+    df_count = read_sql(query, conn)
 
     # creating new columns in the df, for plotting the percent (gender ratio) given total participants for
     # specific games/year
@@ -435,6 +670,13 @@ def get_gender_ratio_change(conn, include_dns=True):
     )
     df_count["game_season"] = df_count["title"].str.extract(r"(Summer|Winter)")
 
+    return df_count
+
+
+@tracing.traced("plot")
+def plot_gender_ratio(df_count: pd.DataFrame):
+    import matplotlib.pyplot as plt
+
     # extracting Summer / Winter
     df_count_summer = df_count[df_count["game_season"] == "Summer"]
     df_count_winter = df_count[df_count["game_season"] == "Winter"]
@@ -488,104 +730,354 @@ def get_gender_ratio_change(conn, include_dns=True):
     plt.show()
 
 
+@tracing.traced("analysis")
+def get_gender_ratio_change(conn, include_dns=True):
+    """
+    Plots the share of male and female participants of every game.
+
+    Args:
+    - conn: Database connection object.
+    - include_dns: Whether to include athletes with DNS (DID NOT START).
+    """
+
+    plot_gender_ratio(query_gender_ratio(conn, include_dns))
+
+
 # --------------------------------#
 # ---------- Functions ----------#
 # --------------------------------#
 
 
-def get_results_table(conn):
-    cur = conn.cursor()
+def copy_to_dataframe(conn, query: str) -> pd.DataFrame:
+    """
+    Streams the rows of a query from Postgres with COPY (query) TO STDOUT in CSV format straight into the
+    pyarrow CSV parser, through a pipe written by a second thread. Unlike fetchall() no Python object is
+    built per value and the rows are never held twice in memory. The C parser of pandas is several times
+    slower on the nullable integer columns.
 
-    cur.execute("Select * FROM result WHERE result.position IN ('1', '2', '3')")
-    results = cur.fetchall()
+    Args:
+    - conn: psycopg2 connection object.
+    - query: SELECT statement.
+    """
 
-    # Creating a df object and formating the column headers
-    df_results = pd.DataFrame(results)
-    colnames = [d[0] for d in cur.description]
-    df_results.columns = colnames
-    df_results.set_index("result_id", inplace=True)
+    from pyarrow import csv
+    import pyarrow as pa
+
+    arrow_types = {"Int64": pa.int64(), "Int16": pa.int16(), "float64": pa.float64(), "boolean": pa.bool_()}
+    pandas_types = {pa.int64(): pd.Int64Dtype(), pa.int16(): pd.Int16Dtype(), pa.bool_(): pd.BooleanDtype()}
 
+    # Every column gets its type up front, text columns would be parsed as numbers otherwise
+    cur = conn.cursor()
+    cur.execute(f"SELECT * FROM ({query}) AS q LIMIT 0")
+    columns = [d[0] for d in cur.description]
     cur.close()
-    return df_results
+    column_types = {
+        column: (
+            pa.date32()
+            if column in DATE_COLUMNS
+            else arrow_types.get(COLUMN_DTYPES.get(column), pa.string())
+        )
+        for column in columns
+    }
+    # NULL is an empty field, everything else is kept as written (no "NA", "null", ... parsing)
+    convert_options = csv.ConvertOptions(
+        column_types=column_types,
+        null_values=[""],
+        strings_can_be_null=True,
+        true_values=["t"],
+        false_values=["f"],
+    )
 
+    read_fd, write_fd = os.pipe()
+    copy_errors = []
+
+    def copy():
+        cur = conn.cursor()
+        try:
+            with open(write_fd, "wb") as writer:
+                cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", writer)
+        except Exception as error:
+            copy_errors.append(error)
+        finally:
+            cur.close()
+
+    thread = threading.Thread(target=copy)
+    thread.start()
+    try:
+        with open(read_fd, "rb") as reader:
+            table = csv.read_csv(reader, convert_options=convert_options)
+    except Exception:
+        # Closing the pipe stopped the copy, a failed copy ended the input of the parser early
+        thread.join()
+        if copy_errors and not isinstance(copy_errors[0], BrokenPipeError):
+            raise copy_errors[0]
+        raise
+    thread.join()
+    if copy_errors:
+        raise copy_errors[0]
+    return table.to_pandas(types_mapper=pandas_types.get, date_as_object=False)
+
+
+def read_query(conn, query: str) -> pd.DataFrame:
+    """
+    Returns the rows of a query as a DataFrame with the column types of `COLUMN_DTYPES` and `DATE_COLUMNS`,
+    the same for both database backends, made smaller by `compact_dtypes` if `COMPACT_DTYPES` is set. On
+    Postgres the rows are fetched with `copy_to_dataframe`. Results are kept in the on-disk query cache.
 
-def get_athlete_table(conn):
-    cur = conn.cursor()
+    Args:
+    - conn: Database connection object.
+    - query: SELECT statement.
+    """
 
-    cur.execute("Select athlete_id, gender, name, country_id FROM athlete")
-    athletes = cur.fetchall()
+    def load():
+        if isinstance(conn, psycopg2.extensions.connection):
+            df = copy_to_dataframe(conn, query)
+        else:
+            df = conn.execute(query).df()
+        df = apply_column_dtypes(df)
+        return compact_dtypes(df) if COMPACT_DTYPES else df
 
-    # Creating a df object and formating the column headers
-    df_athletes = pd.DataFrame(athletes)
-    colnames = [d[0] for d in cur.description]
-    df_athletes.columns = colnames
-    df_athletes.set_index("athlete_id", inplace=True)
+    # Parquet keeps the categoricals and small integers, the reader tells both versions apart
+    reader = "read_query_compact" if COMPACT_DTYPES else "read_query"
+    with tracing.query_span(conn, query, "read_query") as record:
+        df = cached_query(conn, query, load, reader=reader)
+        record["rows_out"] = len(df)
+    return df
 
-    cur.close()
-    return df_athletes
 
+def apply_column_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.astype({column: dtype for column, dtype in COLUMN_DTYPES.items() if column in df.columns})
+    for column in DATE_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column]).astype("datetime64[ns]")
+    return df
 
-def get_game_table(conn):
-    cur = conn.cursor()
 
-    cur.execute("Select * FROM game WHERE was_held IS true")
-    game = cur.fetchall()
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns `df` with the smallest column types that hold its values:
+    - text columns with few distinct values (gender, position, country_id, title, game_season, ...) become
+      categoricals, every value is stored once and every row only keeps a small integer code, so masks like
+      `df["position"] == "1"` compare integers instead of Python strings;
+    - integer columns (ids, year, ...) are downcast to the smallest integer type, nullable ones stay nullable;
+    - text columns holding nothing but True/False become nullable booleans.
+    Floats and dates are kept as they are.
 
-    # Creating a df object and formating the column headers
-    df_games = pd.DataFrame(game)
-    colnames = [d[0] for d in cur.description]
-    df_games.columns = colnames
-    df_games.set_index("game_id", inplace=True)
+    Args:
+    - df: DataFrame to convert.
+    """
 
-    cur.close()
-    return df_games
+    types = {}
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_integer_dtype(series.dtype):
+            downcast = pd.to_numeric(series, downcast="integer")
+            if downcast.dtype != series.dtype:
+                types[column] = downcast.dtype
+        elif series.dtype == object or isinstance(series.dtype, pd.StringDtype):
+            values = series.dropna()
+            kind = pd.api.types.infer_dtype(values, skipna=True)
+            if kind == "boolean":
+                types[column] = "boolean"
+            elif kind == "string" and values.nunique() <= CATEGORY_MAX_UNIQUE_RATIO * len(values):
+                types[column] = "category"
+
+    return df.astype(types) if types else df
+
+
+def memory_report(frames: dict) -> pd.DataFrame:
+    """
+    Returns the number of rows and the memory in MB (strings included) of every DataFrame of `frames`,
+    with the column taking the most memory. Values that are not DataFrames are left out.
 
+    Args:
+    - frames: DataFrames by name, e.g. the results of `run_report`.
+    """
 
-def get_country_table(conn):
-    cur = conn.cursor()
+    rows = []
+    for name, df in frames.items():
+        if not isinstance(df, pd.DataFrame):
+            continue
+        usage = df.memory_usage(deep=True)
+        columns = usage.drop("Index")
+        rows.append(
+            {
+                "frame": name,
+                "rows": len(df),
+                "memory_mb": round(usage.sum() / 1024**2, 2),
+                "largest_column": columns.idxmax() if len(columns) else None,
+                "largest_column_mb": round(columns.max() / 1024**2, 2) if len(columns) else 0.0,
+            }
+        )
+    return pd.DataFrame(rows, columns=["frame", "rows", "memory_mb", "largest_column", "largest_column_mb"])
+
+
+def iter_query(conn, query: str, batch_size: int = BATCH_SIZE):
+    """
+    Yields the rows of a query as DataFrames of at most `batch_size` rows, typed by `apply_column_dtypes`.
+    Only one batch is held in memory at a time: on Postgres the rows stay in a server-side (named) cursor
+    until they are fetched, on DuckDB they are converted one record batch at a time. The batches are not
+    compacted, the categories of every batch would differ.
 
-    cur.execute("Select * FROM country")
-    country = cur.fetchall()
+    Args:
+    - conn: Database connection object.
+    - query: SELECT statement.
+    - batch_size: Most rows per DataFrame.
+    """
 
-    # Creating a df object and formating the column headers
-    df_countries = pd.DataFrame(country)
-    colnames = [d[0] for d in cur.description]
-    df_countries.columns = colnames
-    df_countries.set_index("country_id", inplace=True)
+    if not isinstance(conn, psycopg2.extensions.connection):
+        with tracing.query_span(conn, query, "iter_query"):
+            reader = iter(conn.execute(query).fetch_record_batch(batch_size))
+        for index in itertools.count():
+            with tracing.span("iter_query", "fetch", batch=index) as record:
+                batch = next(reader, None)
+                batch = None if batch is None else apply_column_dtypes(batch.to_pandas())
+                record["rows_out"] = 0 if batch is None else len(batch)
+            if batch is None:
+                return
+            yield batch
+
+    cur = conn.cursor(name=f"iter_query_{next(CURSOR_IDS)}")
+    try:
+        with tracing.query_span(conn, query, "iter_query"):
+            cur.execute(query)
+        for index in itertools.count():
+            with tracing.span("iter_query", "fetch", batch=index) as record:
+                rows = cur.fetchmany(batch_size)
+                # the description of a named cursor is only known after the first fetch
+                columns = [d[0] for d in cur.description] if rows else []
+                batch = apply_column_dtypes(pd.DataFrame(rows, columns=columns)) if rows else None
+                record["rows_out"] = len(rows)
+            if batch is None:
+                break
+            yield batch
+    finally:
+        cur.close()
+
+
+def aggregate_batches(batches, by: list, column: str) -> pd.DataFrame:
+    """
+    Returns the count, sum and mean of `column` per group of `by` over all batches of an iterator like
+    `iter_query`. Only the current batch and the running totals per group are held in memory, so the size
+    of the input is not limited by the memory of the client. Missing values are not counted.
 
-    cur.close()
-    return df_countries
+    Args:
+    - batches: Iterable of DataFrames with the columns `by` and `column`.
+    - by: Columns to group by.
+    - column: Column to aggregate.
+    """
 
+    totals = None
+    for batch in batches:
+        partial = batch.groupby(by)[column].agg(["count", "sum"])
+        totals = partial if totals is None else totals.add(partial, fill_value=0)
 
-def get_event_table(conn):
-    cur = conn.cursor()
+    if totals is None:
+        return pd.DataFrame(columns=["count", "sum", "mean"])
+    totals["mean"] = totals["sum"] / totals["count"]
+    return totals.sort_index()
 
-    cur.execute("Select * FROM event")
-    event = cur.fetchall()
 
-    # Creating a df object and formating the column headers
-    df_event = pd.DataFrame(event)
-    colnames = [d[0] for d in cur.description]
-    df_event.columns = colnames
-    df_event.set_index("event_id", inplace=True)
+def iter_results_table(conn, batch_size: int = BATCH_SIZE):
+    """
+    Batch version of `get_results_table`, see `iter_query`.
+    """
 
-    cur.close()
-    return df_event
+    for df_results in iter_query(
+        conn, "Select * FROM result WHERE result.position IN ('1', '2', '3')", batch_size
+    ):
+        yield df_results.set_index("result_id")
 
 
-def get_sport_table(conn):
-    cur = conn.cursor()
+def iter_athlete_table(conn, batch_size: int = BATCH_SIZE):
+    """
+    Batch version of `get_athlete_table`, see `iter_query`.
+    """
 
-    cur.execute("Select * FROM sport")
-    sport = cur.fetchall()
+    for df_athletes in iter_query(
+        conn, "Select athlete_id, gender, name, country_id FROM athlete", batch_size
+    ):
+        yield df_athletes.set_index("athlete_id")
 
-    # Creating a df object and formating the column headers
-    df_sport = pd.DataFrame(sport)
-    colnames = [d[0] for d in cur.description]
-    df_sport.columns = colnames
-    df_sport.set_index("sport_id", inplace=True)
 
-    cur.close()
+@tracing.traced("analysis")
+def average_age_per_year_in_batches(conn, by=("year",), batch_size: int = BATCH_SIZE) -> pd.DataFrame:
+    """
+    Average age of the athletes per group of `by` (columns of `ATHLETE_AGE_QUERY`, e.g. year, game_season,
+    gender), computed batch by batch from `ATHLETE_AGE_QUERY` with flat client memory.
+
+    Args:
+    - conn: Database connection object.
+    - by: Columns to group by.
+    - batch_size: Rows per batch.
+    """
+
+    return aggregate_batches(iter_query(conn, ATHLETE_AGE_QUERY, batch_size), list(by), "age")
+
+
+@tracing.traced("analysis")
+def count_medals_in_batches(conn, batch_size: int = BATCH_SIZE) -> pd.DataFrame:
+    """
+    Number of medals won by every country per year, like `query_country_medals` but counted batch by batch
+    from the result table with flat client memory.
+
+    Args:
+    - conn: Database connection object.
+    - batch_size: Rows per batch.
+    """
+
+    query = """
+    SELECT c.name AS country, g.year, 1 AS medal
+    FROM result r
+    JOIN game g ON r.game_id = g.game_id
+    JOIN athlete a ON r.athlete_id = a.athlete_id
+    JOIN country c ON a.country_id = c.country_id
+    WHERE r.position IN ('1', '2', '3')
+    """
+
+    totals = aggregate_batches(iter_query(conn, query, batch_size), ["country", "year"], "medal")
+    return totals["count"].astype("int64").rename("total_medals").reset_index()
+
+
+@tracing.traced("analysis")
+def get_results_table(conn):
+    df_results = read_query(conn, "Select * FROM result WHERE result.position IN ('1', '2', '3')")
+    df_results.set_index("result_id", inplace=True)
+    return df_results
+
+
+@tracing.traced("analysis")
+def get_athlete_table(conn):
+    df_athletes = read_query(conn, "Select athlete_id, gender, name, country_id FROM athlete")
+    df_athletes.set_index("athlete_id", inplace=True)
+    return df_athletes
+
+
+@tracing.traced("analysis")
+def get_game_table(conn):
+    df_games = read_query(conn, "Select * FROM game WHERE was_held IS true")
+    df_games.set_index("game_id", inplace=True)
+    return df_games
+
+
+@tracing.traced("analysis")
+def get_country_table(conn):
+    df_countries = read_query(conn, "Select * FROM country")
+    df_countries.set_index("country_id", inplace=True)
+    return df_countries
+
+
+@tracing.traced("analysis")
+def get_event_table(conn):
+    df_event = read_query(conn, "Select * FROM event")
+    df_event.set_index("event_id", inplace=True)
+    return df_event
+
+
+@tracing.traced("analysis")
+def get_sport_table(conn):
+    df_sport = read_query(conn, "Select * FROM sport")
+    df_sport.set_index("sport_id", inplace=True)
     return df_sport
 
 
@@ -621,22 +1113,85 @@ def host_country_advantage_in_medal_count(conn):
 """
 
 
+# ------------------------------#
+# ---------- Report ----------#
+# ------------------------------#
+
+# Independent analyses of the report: the query runs on a pooled connection, the plot (if any) afterwards on
+# the main thread, as matplotlib is not thread-safe
+REPORT = {
+    "average_ages": (lambda conn: split_average_ages(query_average_ages(conn)), plot_average_ages),
+    "gender_ratio": (query_gender_ratio, plot_gender_ratio),
+    "gender_ratio_no_dns": (lambda conn: query_gender_ratio(conn, include_dns=False), plot_gender_ratio),
+    "country_medals": (query_country_medals, plot_country_medals),
+    "results": (get_results_table, None),
+    "athletes": (get_athlete_table, None),
+    "games": (get_game_table, None),
+    "countries": (get_country_table, None),
+    "events": (get_event_table, None),
+    "sports": (get_sport_table, None),
+}
+
+# Analyses of `REPORT` with an approximate version, see `APPROXIMATE`
+APPROXIMATE_REPORT = {
+    "average_ages": (lambda conn: split_average_ages(estimate_average_ages(conn)), plot_average_ages),
+}
+
+
+def run_report(pool: ConnectionPool, report: dict = REPORT, workers: int = POOL_SIZE) -> dict:
+    """
+    Runs the queries of all analyses concurrently, each on its own connection of `pool`, and plots every
+    analysis as soon as its data arrived. The report takes about as long as its slowest query instead of
+    the sum of all of them. Returns the data of every analysis.
+
+    Args:
+    - pool: ConnectionPool to run the queries on.
+    - report: Query and plot function of every analysis, see `REPORT`.
+    - workers: Number of queries running at the same time.
+    """
+
+    def fetch(name):
+        start = time.perf_counter()
+        with pool.connection() as conn:
+            data = report[name][0](conn)
+        return data, time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = {}
+    query_time = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch, name): name for name in report}
+        for future in as_completed(futures):
+            name = futures[future]
+            results[name], elapsed = future.result()
+            query_time += elapsed
+            print(f"Fetched {name} in {elapsed:.2f}s")
+
+            plot = report[name][1]
+            if plot is not None:
+                plot(results[name])
+
+    print(
+        f"Report done in {time.perf_counter() - start:.2f}s "
+        f"({query_time:.2f}s of queries on {workers} connections)"
+    )
+    return results
+
+
 # main function
 def main():
-    # db params
-    db_config_params = DBConfig()
-
-    # connect to db
-    conn = connect_to_db(db_config_params)
+    # connection pool of the database of database.BACKEND
+    pool = ConnectionPool()
 
-    # creating dataframe from db and plotting
-    df_athletes_ages = get_table_with_calculated_age(conn=conn)
-    # print(df_athletes_ages.head())
+    # querying all analyses concurrently and plotting
+    results = run_report(pool)
+    pool.close()
 
-    get_gender_ratio_change(conn=conn, include_dns=True)
-    conn.close()
+    # memory of every loaded DataFrame
+    print(memory_report(results).to_string(index=False))
 
 
 if __name__ == "__main__":
 
     main()
+    tracing.write_trace()
@@ -0,0 +1,129 @@
+import os
+import re
+import time
+import numpy as np
+import pandas as pd
+
+from cleaning import extract_first_int, null_unless_in
+from format_csv_files import CSV_NAMES, DATASET_PATH
+
+# ----------------------------
+# ---------- CONFIG ----------
+# ----------------------------
+
+SCALE_FACTORS = [1, 10]
+REPEATS = 3
+
+# Weight values as they appear in Olympic_Athlete_Bio.csv
+RAW_WEIGHTS = ["72", "", "60-65", "ca 80", "101, 99", "55.5", None]
+
+# ------------------------------------------------
+# ---------- ROW-WISE REFERENCE VERSIONS ----------
+# ------------------------------------------------
+
+
+def clean_weight_apply(series: pd.Series) -> pd.Series:
+    def clean_weight(value):
+        if pd.isna(value):
+            return None  # Handle NaN
+        match = re.search(r"\d+", str(value))  # Extract the first number
+        return int(match.group()) if match else None
+
+    return series.apply(clean_weight)
+
+
+def replace_invalid_athlete_ids_apply(series: pd.Series, athlete_ids: pd.Series):
+    valid_athlete_ids = set(athlete_ids)
+    return series.apply(lambda x: x if x in valid_athlete_ids else pd.NA)
+
+
+# ---------------------------
+# ---------- UTILS ----------
+# ---------------------------
+
+
+def load_columns(scale_factor: int):
+    """
+    Returns the athlete_id column of the result table, scaled up by repeating it `scale_factor` times with
+    shifted ids, a weight column of the same length and the valid athlete ids.
+    """
+
+    result_df = pd.read_csv(os.path.join(DATASET_PATH, CSV_NAMES["Result"]))
+    athlete_df = pd.read_csv(os.path.join(DATASET_PATH, CSV_NAMES["Athlete"]))
+
+    athlete_ids = athlete_df["athlete_id"]
+    result_athlete_ids = result_df["athlete_id"].fillna(-1).astype("int64")
+
+    # Every copy uses new ids, half of which are valid
+    offset = int(athlete_ids.max()) + 1
+    result_athlete_ids = pd.concat(
+        [result_athlete_ids + i * offset for i in range(scale_factor)],
+        ignore_index=True,
+    )
+    athlete_ids = pd.concat(
+        [athlete_ids + i * offset for i in range(0, scale_factor, 2)],
+        ignore_index=True,
+    )
+
+    rng = np.random.default_rng(0)
+    weights = pd.Series(
+        rng.choice(np.array(RAW_WEIGHTS, dtype=object), len(result_athlete_ids))
+    )
+
+    return result_athlete_ids, weights, athlete_ids
+
+
+def best_time(function, *args) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def assert_same_values(expected: pd.Series, actual: pd.Series):
+    expected = pd.to_numeric(expected).astype("Int64")
+    if not expected.equals(actual):
+        raise AssertionError("Vectorized transform does not match the row-wise version")
+
+
+# ----------------------------------
+# ---------- BENCHMARKING ----------
+# ----------------------------------
+
+
+def main():
+    print(f"{'transform':<28}{'rows':>12}{'apply [s]':>12}{'vector [s]':>12}{'speedup':>10}")
+
+    for scale_factor in SCALE_FACTORS:
+        result_athlete_ids, weights, athlete_ids = load_columns(scale_factor)
+
+        cases = [
+            (
+                "clean weight",
+                (clean_weight_apply, (weights,)),
+                (extract_first_int, (weights,)),
+            ),
+            (
+                "replace invalid athlete ids",
+                (replace_invalid_athlete_ids_apply, (result_athlete_ids, athlete_ids)),
+                (null_unless_in, (result_athlete_ids, athlete_ids)),
+            ),
+        ]
+
+        for name, (apply_function, apply_args), (vector_function, vector_args) in cases:
+            assert_same_values(apply_function(*apply_args), vector_function(*vector_args))
+
+            apply_time = best_time(apply_function, *apply_args)
+            vector_time = best_time(vector_function, *vector_args)
+
+            print(
+                f"{name:<28}{len(result_athlete_ids):>12}{apply_time:>12.3f}"
+                f"{vector_time:>12.3f}{apply_time / vector_time:>9.1f}x"
+            )
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,111 @@
+import re
+import time
+import warnings
+import matplotlib
+
+# Plots are only rendered, never shown
+matplotlib.use("Agg")
+warnings.filterwarnings("ignore", message=".*non-interactive.*")
+
+import matplotlib.pyplot as plt
+from psycopg2 import sql
+
+import analyze_data
+import query_cache
+from database import DBConfig, connect_to_db
+from load_data import SCHEMA_PATH, run_sql_file
+
+# ----------------------------
+# ---------- CONFIG ----------
+# ----------------------------
+
+REPEATS = 3
+
+ANALYSES = {
+    "get_country_medals_over_time": analyze_data.get_country_medals_over_time,
+    "get_table_with_calculated_age": analyze_data.get_table_with_calculated_age,
+    "get_gender_ratio_change": lambda conn: analyze_data.get_gender_ratio_change(conn, include_dns=True),
+    "get_gender_ratio_change (no DNS)": lambda conn: analyze_data.get_gender_ratio_change(
+        conn, include_dns=False
+    ),
+    "get_results_table": analyze_data.get_results_table,
+}
+
+# ---------------------------
+# ---------- UTILS ----------
+# ---------------------------
+
+
+def get_schema_indexes() -> list:
+    with open(SCHEMA_PATH) as file:
+        return re.findall(r"CREATE INDEX IF NOT EXISTS (\w+)", file.read())
+
+
+def vacuum_analyze(conn):
+    # Also sets the visibility map, without it the planner does not use index-only scans
+    conn.commit()
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("VACUUM ANALYZE")
+    cur.close()
+    conn.autocommit = False
+
+
+def drop_indexes(conn, indexes: list):
+    cur = conn.cursor()
+    for index in indexes:
+        cur.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(index)))
+    cur.close()
+    vacuum_analyze(conn)
+
+
+def create_indexes(conn):
+    run_sql_file(conn, SCHEMA_PATH)
+    vacuum_analyze(conn)
+
+
+def time_analyses(conn) -> dict:
+    timings = {}
+    for name, analysis in ANALYSES.items():
+        best = float("inf")
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            analysis(conn)
+            best = min(best, time.perf_counter() - start)
+            plt.close("all")
+        timings[name] = best
+    return timings
+
+
+# ----------------------------------
+# ---------- BENCHMARKING ----------
+# ----------------------------------
+
+
+def main():
+    # every analysis has to run its queries, index changes keep the version stamps of the query cache
+    query_cache.USE_QUERY_CACHE = False
+
+    conn = connect_to_db(DBConfig())
+    indexes = get_schema_indexes()
+
+    drop_indexes(conn, indexes)
+    before = time_analyses(conn)
+
+    create_indexes(conn)
+    after = time_analyses(conn)
+
+    conn.close()
+
+    print(f"Indexes: {indexes}")
+    print(f"{'analysis':<36}{'before [s]':>12}{'after [s]':>12}{'speedup':>10}")
+    for name in ANALYSES:
+        print(
+            f"{name:<36}{before[name]:>12.3f}{after[name]:>12.3f}"
+            f"{before[name] / after[name]:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+
+    main()
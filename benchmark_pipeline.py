@@ -0,0 +1,291 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import analyze_data
+import format_csv_files
+import query_cache
+from database import DBConfig, connect_to_db
+from embedded_database import DuckDBConfig, connect_to_duckdb
+from format_csv_files import CSV_NAME_MAPPING, CSV_NAMES, DATASET_FOLDER, IRRELEVANT_FILES
+from generate_dataset import SEED, generate_dataset
+from load_data import create_tables, load_dataset, refresh_views, truncate_tables
+
+# ----------------------------
+# ---------- CONFIG ----------
+# ----------------------------
+
+SCALE_FACTORS = [1, 10, 100]
+
+# Generated source files and formatted tables of every scale factor, generated files are reused by later runs
+BENCHMARK_DIRECTORY = "./benchmark_data"
+
+# Every timing is appended as a JSON line, so that the runs of different commits can be compared
+RESULTS_PATH = "./benchmark_results.jsonl"
+
+# "postgres" loads the generated dataset into the database of `DBConfig`, replacing the rows of its tables
+BACKENDS = ["postgres", "duckdb"]
+
+# Best of this many runs of every analysis, the formatting stages and the load run once
+REPEATS = 3
+
+# Timings this many times slower than the best earlier run of the same step are reported as regressions,
+# unless they are less than `REGRESSION_MIN_SECONDS` slower (timer noise of the fast queries)
+REGRESSION_THRESHOLD = 1.25
+REGRESSION_MIN_SECONDS = 0.05
+
+# Format stages in the order of the "staged" mode of format_csv_files.py
+FORMAT_STAGES = {
+    "format_countries": format_csv_files.format_countries,
+    "format_athletes": format_csv_files.format_athletes,
+    "format_games": format_csv_files.format_games,
+    "format_results": format_csv_files.format_results,
+    "format_sports": format_csv_files.format_sports,
+    "format_events": format_csv_files.format_events,
+}
+
+# Query functions of analyze_data.py, without plotting
+ANALYSES = {
+    "query_country_medals": analyze_data.query_country_medals,
+    "query_average_ages": analyze_data.query_average_ages,
+    "compute_average_ages": analyze_data.compute_average_ages,
+    "query_gender_ratio": analyze_data.query_gender_ratio,
+    "query_gender_ratio (no DNS)": lambda conn: analyze_data.query_gender_ratio(conn, include_dns=False),
+    "get_results_table": analyze_data.get_results_table,
+    "get_athlete_table": analyze_data.get_athlete_table,
+    "get_game_table": analyze_data.get_game_table,
+    "get_event_table": analyze_data.get_event_table,
+    "average_age_per_year_in_batches": analyze_data.average_age_per_year_in_batches,
+    "count_medals_in_batches": analyze_data.count_medals_in_batches,
+    "estimate_average_ages": analyze_data.estimate_average_ages,
+}
+
+# ---------------------------
+# ---------- UTILS ----------
+# ---------------------------
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextlib.contextmanager
+def working_directory(path: str):
+    # the format stages work on the relative `DATASET_PATH`
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def measure(function, *args, repeats: int = 1) -> tuple:
+    """
+    Returns the best time in seconds of `repeats` calls of `function` and the result of the last call. The
+    messages it prints are dropped.
+    """
+
+    best = float("inf")
+    for _ in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = function(*args)
+            best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def count_rows(result):
+    if isinstance(result, tuple):
+        result = result[0]
+    return len(result) if hasattr(result, "__len__") else None
+
+
+def get_scale_directory(scale_factor) -> str:
+    return os.path.abspath(os.path.join(BENCHMARK_DIRECTORY, f"scale_{scale_factor}"))
+
+
+def prepare_sources(scale_factor) -> str:
+    """
+    Returns the folder of the generated source files of a scale factor, generating them on first use.
+    """
+
+    source_directory = os.path.join(get_scale_directory(scale_factor), f"source_{SEED}")
+    if not os.path.isdir(source_directory):
+        generate_dataset(f"{source_directory}.tmp", scale_factor, SEED)
+        os.replace(f"{source_directory}.tmp", source_directory)
+    return source_directory
+
+
+def load_previous_results() -> list:
+    if not os.path.exists(RESULTS_PATH):
+        return []
+    with open(RESULTS_PATH) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def save_results(records: list):
+    with open(RESULTS_PATH, "a") as file:
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+
+
+def get_step_key(record: dict) -> tuple:
+    return record["scale_factor"], record["backend"], record["step"]
+
+
+# ----------------------------------
+# ---------- BENCHMARKING ----------
+# ----------------------------------
+
+
+def benchmark_formatting(scale_factor) -> tuple:
+    """
+    Formats the generated source files of a scale factor one `FORMAT_STAGES` stage at a time, like the
+    "staged" mode of format_csv_files.py. Returns the timings and the folder of the formatted tables.
+    """
+
+    scale_directory = get_scale_directory(scale_factor)
+    source_directory = prepare_sources(scale_factor)
+    dataset_path = os.path.join(scale_directory, DATASET_FOLDER)
+
+    shutil.rmtree(dataset_path, ignore_errors=True)
+    shutil.copytree(source_directory, dataset_path)
+    for file in IRRELEVANT_FILES:
+        if os.path.exists(os.path.join(dataset_path, file)):
+            os.remove(os.path.join(dataset_path, file))
+    for old_name, new_name in CSV_NAME_MAPPING.items():
+        os.rename(os.path.join(dataset_path, old_name), os.path.join(dataset_path, new_name))
+
+    timings = {}
+    with working_directory(scale_directory):
+        for name, stage in FORMAT_STAGES.items():
+            timings[name] = (measure(stage)[0], None)
+    return timings, dataset_path
+
+
+def benchmark_analyses(conn) -> dict:
+    """
+    Returns the best time of every analysis of `ANALYSES` and the number of rows it returned.
+    """
+
+    timings = {}
+    for name, analysis in ANALYSES.items():
+        seconds, result = measure(analysis, conn, repeats=REPEATS)
+        timings[name] = (seconds, count_rows(result))
+    return timings
+
+
+def benchmark_postgres(dataset_path: str) -> dict:
+    conn = connect_to_db(DBConfig())
+    tables = {name: os.path.join(dataset_path, CSV_NAMES[name]) for name in CSV_NAMES}
+
+    timings = {}
+    create_tables(conn)
+    timings["truncate"] = (measure(truncate_tables, conn)[0], None)
+    timings["load"] = (measure(load_dataset, conn, tables)[0], None)
+    timings["refresh_views"] = (measure(refresh_views, conn)[0], None)
+    timings.update(benchmark_analyses(conn))
+    conn.close()
+    return timings
+
+
+def benchmark_duckdb(dataset_path: str) -> dict:
+    class BenchmarkDuckDBConfig(DuckDBConfig):
+        DATASET_PATH = dataset_path
+
+    timings = {}
+    seconds, conn = measure(connect_to_duckdb, BenchmarkDuckDBConfig)
+    timings["load"] = (seconds, None)
+    timings.update(benchmark_analyses(conn))
+    conn.close()
+    return timings
+
+
+def print_results(records: list, previous: list):
+    """
+    Prints every timing next to the best earlier run of the same step and flags the ones slower than
+    `REGRESSION_THRESHOLD` times that.
+    """
+
+    best_previous = {}
+    for record in previous:
+        key = get_step_key(record)
+        best_previous[key] = min(best_previous.get(key, float("inf")), record["seconds"])
+
+    print(f"{'scale':>6} {'backend':<9}{'step':<34}{'rows':>11}{'time [s]':>10}{'best before':>13}{'':>12}")
+    for record in records:
+        before = best_previous.get(get_step_key(record))
+        ratio = "" if before is None else f"{record['seconds'] / max(before, 1e-9):.2f}x"
+        is_slower = (
+            before is not None
+            and record["seconds"] > REGRESSION_THRESHOLD * before
+            and record["seconds"] - before > REGRESSION_MIN_SECONDS
+        )
+        flag = "REGRESSION" if is_slower else ""
+        rows = "" if record["rows"] is None else record["rows"]
+        print(
+            f"{record['scale_factor']:>6} {record['backend'] or '':<9}{record['step']:<34}{rows:>11}"
+            f"{record['seconds']:>10.3f}{'' if before is None else f'{before:.3f}':>13} {ratio:>6} {flag}"
+        )
+
+
+def main(scale_factors=SCALE_FACTORS, backends=BACKENDS):
+    """
+    Times every format stage, the load and every analysis on generated datasets of every scale factor,
+    prints them next to the best earlier timings and appends them to `RESULTS_PATH`.
+
+    Args:
+    - scale_factors: Multiples of the size of the Kaggle snapshot, see generate_dataset.py.
+    - backends: Databases to load and analyze, see `BACKENDS`.
+    """
+
+    # every analysis has to run its queries
+    query_cache.USE_QUERY_CACHE = False
+
+    run = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    commit = get_git_commit()
+    records = []
+
+    def add(scale_factor, backend, timings):
+        for step, (seconds, rows) in timings.items():
+            records.append(
+                {
+                    "run": run,
+                    "commit": commit,
+                    "scale_factor": scale_factor,
+                    "backend": backend,
+                    "step": step,
+                    "rows": rows,
+                    "seconds": round(seconds, 4),
+                }
+            )
+
+    for scale_factor in scale_factors:
+        print(f"Scale factor {scale_factor}")
+        timings, dataset_path = benchmark_formatting(scale_factor)
+        add(scale_factor, None, timings)
+
+        for backend in backends:
+            if backend == "postgres":
+                add(scale_factor, backend, benchmark_postgres(dataset_path))
+            elif backend == "duckdb":
+                add(scale_factor, backend, benchmark_duckdb(dataset_path))
+
+    print_results(records, load_previous_results())
+    save_results(records)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,85 @@
+import subprocess
+import sys
+import time
+
+# ----------------------------
+# ---------- CONFIG ----------
+# ----------------------------
+
+REPEATS = 5
+
+# Commands timed from process start to exit. The analyze commands need the database and are answered from
+# the query cache after their first run.
+COMMANDS = [
+    ["cli.py", "--help"],
+    ["cli.py", "analyze", "--help"],
+    ["cli.py", "load", "--mode", "unknown"],
+    ["cli.py", "analyze", "country_medals"],
+]
+
+# Commands answered from the output cache of the CLI once they ran, on both backends. The benchmark fails if
+# one of them takes longer than `CACHED_TARGET` seconds.
+CACHED_COMMANDS = [
+    ["cli.py", "analyze", "countries", "--rows", "1", "--backend", "postgres"],
+    ["cli.py", "analyze", "countries", "--rows", "1", "--backend", "duckdb"],
+]
+
+CACHED_TARGET = 0.3
+
+# Modules timed by importing them alone
+MODULES = ["format_csv_files", "load_data", "analyze_data", "export_report"]
+
+# ---------------------------
+# ---------- UTILS ----------
+# ---------------------------
+
+
+def best_time(arguments: list) -> tuple:
+    """
+    Returns the best wall time over `REPEATS` runs of a Python process and its last exit code.
+    """
+
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, *arguments], capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return min(timings), completed.returncode
+
+
+# ----------------------------------
+# ---------- BENCHMARKING ----------
+# ----------------------------------
+
+
+def main() -> int:
+    baseline, _ = best_time(["-c", "pass"])
+    print(f"{'command':<64}{'time [s]':>10}{'exit':>6}")
+    print(f"{'python -c pass':<64}{baseline:>10.3f}{0:>6}")
+
+    for command in COMMANDS:
+        elapsed, returncode = best_time(command)
+        print(f"{' '.join(command):<64}{elapsed:>10.3f}{returncode:>6}")
+
+    missed = []
+    for command in CACHED_COMMANDS:
+        # the first run fills the cache
+        subprocess.run([sys.executable, *command], capture_output=True)
+        elapsed, returncode = best_time(command)
+        print(f"{' '.join(command):<64}{elapsed:>10.3f}{returncode:>6}")
+        if returncode != 0 or elapsed > CACHED_TARGET:
+            missed.append(" ".join(command))
+
+    for module in MODULES:
+        elapsed, returncode = best_time(["-c", f"import {module}"])
+        print(f"{'import ' + module:<64}{elapsed:>10.3f}{returncode:>6}")
+
+    if missed:
+        print(f"Cached commands failed or took longer than {CACHED_TARGET}s: {', '.join(missed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
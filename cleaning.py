@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+from typing import Callable, Iterable, List
+
+# -----------------------------------------------
+# ---------- VECTORIZED CLEANING RULES ----------
+# -----------------------------------------------
+
+# Every rule takes a whole column and returns the cleaned column, so it runs as a single pandas operation
+# instead of calling back into Python for every row. Missing values are kept as <NA> with nullable dtypes.
+
+
+def map_unique(series: pd.Series, transform: Callable[[pd.Series], pd.Series]) -> pd.Series:
+    """
+    Applies a column transform to the distinct values of a column only and broadcasts the result back to
+    every row. Missing values stay missing. Cleaning rules on free text (weights, dates, ...) are much cheaper
+    this way because the same few hundred values are repeated over the whole column.
+    """
+
+    codes, uniques = pd.factorize(series)
+    transformed = transform(pd.Series(uniques))
+    return pd.Series(
+        transformed.array.take(codes, allow_fill=True),
+        index=series.index,
+        name=series.name,
+    )
+
+
+def to_nullable_int(series: pd.Series) -> pd.Series:
+    """
+    Converts a column to the nullable "Int64" dtype, values that are not numbers become <NA>.
+    """
+
+    return pd.to_numeric(series, errors="coerce").astype("Int64")
+
+
+def extract_first_int(series: pd.Series) -> pd.Series:
+    """
+    Returns the first run of digits of every value as an integer, e.g. "60-65" -> 60 and "ca 80" -> 80.
+    Values without any digit become <NA>.
+    """
+
+    def first_int(values: pd.Series) -> pd.Series:
+        digits = values.astype("string").str.extract(r"(\d+)", expand=False)
+        return to_nullable_int(digits)
+
+    return map_unique(series, first_int)
+
+
+def null_unless_in(series: pd.Series, valid_values: Iterable) -> pd.Series:
+    """
+    Keeps the integer values of a column that appear in `valid_values` and replaces all others with <NA>.
+    """
+
+    is_valid = series.isin(pd.unique(pd.Series(valid_values)))
+    return to_nullable_int(series).where(is_valid)
+
+
+def stable_row_ids(df: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """
+    Returns a positive 63 bit id for every row, computed from the values of `columns` only. The same values
+    always get the same id, whatever the position of the row, the chunk it is in or the run it comes from.
+    Integer columns give the same id whether they are stored as int, float or nullable integers.
+    """
+
+    keys = pd.DataFrame(
+        {
+            column: (
+                to_nullable_int(df[column])
+                if pd.api.types.is_numeric_dtype(df[column])
+                else df[column]
+            ).astype(str)
+            for column in columns
+        }
+    )
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    return pd.Series((hashes >> np.uint64(1)).astype("int64"), index=df.index)
+
+
+def parse_dates(series: pd.Series, formats: List[str]) -> pd.Series:
+    """
+    Parses every value with the first of `formats` it matches, values matching none become NaT. Unlike the
+    format `pd.to_datetime` infers from the first value, the date of a value does not depend on the other
+    values of the column, e.g. on where a chunk starts.
+    """
+
+    def parse(values: pd.Series) -> pd.Series:
+        dates = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+        for date_format in formats:
+            missing = dates.isna()
+            dates[missing] = pd.to_datetime(values[missing], format=date_format, errors="coerce")
+        return dates
+
+    return map_unique(series, parse)
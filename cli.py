@@ -0,0 +1,170 @@
+import argparse
+import sys
+
+# Only the standard library is imported here: every subcommand imports the modules it needs when it runs,
+# so `--help` and wrong arguments return without loading pandas, matplotlib or the database drivers.
+# Options left out keep the defaults of the CONFIG section of the module running the subcommand.
+
+BACKENDS = ["postgres", "duckdb"]
+
+# ---------------------------------
+# ---------- SUBCOMMANDS ----------
+# ---------------------------------
+
+
+def run_format(args) -> int:
+    import format_csv_files
+
+    options = {
+        "mode": args.mode,
+        "output_formats": args.formats,
+        "chunk_size": args.chunk_size,
+        "max_workers": args.workers,
+        "source_directory": args.source,
+    }
+    if args.no_cache:
+        options["use_cache"] = False
+    format_csv_files.main(**{name: value for name, value in options.items() if value is not None})
+    return 0
+
+
+def run_generate(args) -> int:
+    import generate_dataset
+
+    options = {"output_directory": args.output, "scale_factor": args.scale, "seed": args.seed}
+    generate_dataset.main(**{name: value for name, value in options.items() if value is not None})
+    return 0
+
+
+def run_load(args) -> int:
+    import load_data
+
+    if args.mode is None:
+        load_data.main()
+    else:
+        load_data.main(args.mode)
+    return 0
+
+
+def run_analyze(args) -> int:
+    import database
+    import output_cache
+    import tracing
+
+    # The printed rows of a table are cached with the state of the files and tables they were read from, and
+    # answered before pandas is imported or a DuckDB database is built
+    backend = args.backend or database.BACKEND
+    config = database.DBConfig
+    server = [] if backend == "duckdb" else [config.HOST, config.PORT, config.DB_NAME]
+    key = output_cache.get_output_key(["analyze", args.name, args.rows, args.approximate], [backend, *server])
+    if not args.memory:
+        with tracing.span(args.name, "output_cache") as record:
+            output = output_cache.read_output(key, lambda: database.connect(backend))
+            record["cache"] = "miss" if output is None else "hit"
+        if output is not None:
+            print(output)
+            return 0
+
+    import analyze_data
+    import query_cache
+
+    report = analyze_data.APPROXIMATE_REPORT if args.approximate else analyze_data.REPORT
+    if args.name not in report:
+        print(f"Unknown analysis '{args.name}', choose one of: {', '.join(report)}")
+        return 2
+
+    # the get_*_table loaders have no plot, their first rows are printed instead
+    is_table = report[args.name][1] is None
+    pool = database.ConnectionPool(backend=backend)
+    try:
+        # taken before the queries run, so that a change in the meantime makes the next run query again
+        dependencies = query_cache.get_dependencies(pool) if is_table else None
+        data = analyze_data.run_report(pool, {args.name: report[args.name]})[args.name]
+    finally:
+        pool.close()
+
+    if is_table:
+        output = str(data.head(args.rows))
+        print(output)
+        output_cache.store_output(key, output, dependencies)
+    if args.memory:
+        print(analyze_data.memory_report({args.name: data}).to_string(index=False))
+    return 0
+
+
+def run_export(args) -> int:
+    import export_report
+
+    options = {"output_directory": args.output, "formats": args.formats, "backend": args.backend}
+    export_report.main(**{name: value for name, value in options.items() if value is not None})
+    return 0
+
+
+# ----------------------------
+# ---------- PARSER ----------
+# ----------------------------
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="cli.py", description="Formats, loads and analyzes the Olympic Games dataset."
+    )
+    parser.add_argument("--trace", help="JSON file of the trace of the run, see tracing.py")
+    parser.add_argument(
+        "--explain", action="store_true", help="add the plan of every query to the trace, runs them twice"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    format_parser = subparsers.add_parser("format", help="download and format the dataset")
+    format_parser.add_argument("--mode", choices=["pipeline", "parallel", "staged", "streaming"])
+    format_parser.add_argument("--formats", nargs="+", choices=["csv", "parquet"])
+    format_parser.add_argument("--chunk-size", type=int, help="rows per chunk of the streaming mode")
+    format_parser.add_argument("--workers", type=int, help="processes of the parallel mode")
+    format_parser.add_argument("--no-cache", action="store_true", help="run every stage again")
+    format_parser.add_argument("--source", help="folder with the raw files to format instead of downloading")
+    format_parser.set_defaults(run=run_format)
+
+    generate_parser = subparsers.add_parser("generate", help="write synthetic raw files of any size")
+    generate_parser.add_argument("--output", help="folder of the raw files")
+    generate_parser.add_argument("--scale", type=float, help="multiple of the size of the Kaggle snapshot")
+    generate_parser.add_argument("--seed", type=int)
+    generate_parser.set_defaults(run=run_generate)
+
+    load_parser = subparsers.add_parser("load", help="load the formatted dataset into Postgres")
+    load_parser.add_argument("--mode", choices=["copy", "fast", "sync", "refresh"])
+    load_parser.set_defaults(run=run_load)
+
+    analyze_parser = subparsers.add_parser("analyze", help="run and plot a single analysis")
+    analyze_parser.add_argument("name", help="analysis of analyze_data.REPORT, e.g. gender_ratio")
+    analyze_parser.add_argument("--backend", choices=BACKENDS)
+    analyze_parser.add_argument("--rows", type=int, default=5, help="rows printed for a table")
+    analyze_parser.add_argument("--memory", action="store_true", help="print the memory of the DataFrame")
+    analyze_parser.add_argument(
+        "--approximate", action="store_true", help="plot estimates from the samples of the views"
+    )
+    analyze_parser.set_defaults(run=run_analyze)
+
+    export_parser = subparsers.add_parser("export", help="render every figure to files without a display")
+    export_parser.add_argument("--output", help="folder of the figures, manifest and index page")
+    export_parser.add_argument("--formats", nargs="+", help="file formats, e.g. png svg pdf")
+    export_parser.add_argument("--backend", choices=BACKENDS)
+    export_parser.set_defaults(run=run_export)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = get_parser().parse_args(argv)
+
+    # standard library only, like this module
+    import tracing
+
+    tracing.EXPLAIN_QUERIES = tracing.EXPLAIN_QUERIES or args.explain
+    status = args.run(args)
+    tracing.write_trace(args.trace or tracing.TRACE_PATH)
+    return status
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
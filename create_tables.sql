@@ -40,8 +40,9 @@ CREATE TABLE IF NOT EXISTS "event" (
 	FOREIGN KEY (sport_id) REFERENCES sport(sport_id)
 );
 
+-- BIGINT for the stable row ids, load_data.widen_result_ids changes the INT ids of older databases
 CREATE TABLE IF NOT EXISTS "result" (
-	result_id INT PRIMARY KEY,
+	result_id BIGINT PRIMARY KEY,
 	"position" VARCHAR(32),
 	game_id INT,
 	event_id INT,
@@ -50,3 +51,28 @@ CREATE TABLE IF NOT EXISTS "result" (
 	FOREIGN KEY (event_id) REFERENCES "event"(event_id),
 	FOREIGN KEY (athlete_id) REFERENCES athlete(athlete_id)
 );
+
+-- Columns derived from the other columns by the load, see derive_columns.sql. Added by ALTER TABLE so that
+-- databases created before them get them too.
+ALTER TABLE game ADD COLUMN IF NOT EXISTS season VARCHAR(6);
+ALTER TABLE game ADD COLUMN IF NOT EXISTS effective_start_date DATE;
+-- age of the athlete at the game in years
+ALTER TABLE "result" ADD COLUMN IF NOT EXISTS age_at_game DOUBLE PRECISION;
+
+
+-- Indexes for the queries of analyze_data.py
+
+-- Foreign key of every result to its game, also covering the athletes and positions per game so that the
+-- participant counts per game are computed from the index alone
+CREATE INDEX IF NOT EXISTS result_game_id_idx ON "result" (game_id, athlete_id) INCLUDE ("position");
+
+CREATE INDEX IF NOT EXISTS result_athlete_id_idx ON "result" (athlete_id);
+
+CREATE INDEX IF NOT EXISTS result_event_id_idx ON "result" (event_id);
+
+-- Medalists only, about 1 in 7 results
+CREATE INDEX IF NOT EXISTS result_medal_idx ON "result" (game_id, athlete_id) INCLUDE ("position")
+WHERE "position" IN ('1', '2', '3');
+
+-- Gender and date of birth of every athlete for the gender ratio and age aggregations
+CREATE INDEX IF NOT EXISTS athlete_gender_idx ON athlete (athlete_id) INCLUDE (gender, date_of_birth);
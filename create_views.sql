@@ -0,0 +1,64 @@
+-- Aggregates of the result table used by analyze_data.py, refresh them after every load with
+-- load_data.refresh_views
+
+-- Medals won by the athletes of every country at every game
+CREATE MATERIALIZED VIEW IF NOT EXISTS country_medals AS
+SELECT
+	c.country_id,
+	c.name AS country,
+	g.game_id,
+	g.year,
+	COUNT(r.result_id) AS total_medals
+FROM "result" r
+JOIN game g ON r.game_id = g.game_id
+JOIN athlete a ON r.athlete_id = a.athlete_id
+JOIN country c ON a.country_id = c.country_id
+WHERE r."position" IN ('1', '2', '3')
+GROUP BY c.country_id, c.name, g.game_id, g.year;
+
+CREATE UNIQUE INDEX IF NOT EXISTS country_medals_idx ON country_medals (country_id, game_id);
+
+-- Distinct participants of every game per gender, with and without the athletes who did not start (DNS).
+-- Every athlete has a single gender, so the participants of a game are the sum over its genders.
+CREATE MATERIALIZED VIEW IF NOT EXISTS game_participation AS
+SELECT
+	g.game_id,
+	g.year,
+	g.title,
+	a.gender,
+	COUNT(DISTINCT a.athlete_id) AS participants,
+	COUNT(DISTINCT a.athlete_id) FILTER (WHERE NOT r."position" IN ('DNS')) AS participants_started
+FROM "result" r
+JOIN athlete a ON r.athlete_id = a.athlete_id
+JOIN game g ON r.game_id = g.game_id
+GROUP BY g.game_id, g.year, g.title, a.gender;
+
+CREATE UNIQUE INDEX IF NOT EXISTS game_participation_idx ON game_participation (game_id, gender);
+
+-- Stratified sample of the results with an age for the approximate mode of analyze_data.py: at most 300
+-- random results of every stratum of year, season and medal (NULL without a medal), with the number of
+-- results of their stratum. Strata with fewer results, like most medal strata, are complete.
+CREATE MATERIALIZED VIEW IF NOT EXISTS age_sample AS
+SELECT result_id, year, season, medal, gender, age, stratum_rows
+FROM (
+	SELECT
+		*,
+		ROW_NUMBER() OVER (PARTITION BY year, season, medal ORDER BY RANDOM()) AS sample_row,
+		COUNT(*) OVER (PARTITION BY year, season, medal) AS stratum_rows
+	FROM (
+		SELECT
+			r.result_id,
+			g.year,
+			g.season,
+			CASE WHEN r."position" IN ('1', '2', '3') THEN r."position" END AS medal,
+			a.gender,
+			r.age_at_game AS age
+		FROM "result" r
+		JOIN athlete a ON r.athlete_id = a.athlete_id
+		JOIN game g ON r.game_id = g.game_id
+		WHERE r.age_at_game IS NOT NULL
+	) AS ages
+) AS numbered
+WHERE sample_row <= 300;
+
+CREATE UNIQUE INDEX IF NOT EXISTS age_sample_idx ON age_sample (result_id);
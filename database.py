@@ -0,0 +1,113 @@
+import queue
+import threading
+import psycopg2
+from contextlib import contextmanager
+
+# "postgres" runs the analyses on the server of `DBConfig`, "duckdb" on an in-process database built from
+# the formatted dataset files, see embedded_database.py
+BACKEND = "postgres"
+
+# Most connections a `ConnectionPool` opens at the same time
+POOL_SIZE = 4
+
+
+class DBConfig:
+    HOST = "localhost"
+    PORT = "5432"
+    DB_NAME = "olympic_games_history"
+    USERNAME = "postgres"
+    PASSWORD = "XXXXX"
+
+
+# connect to DB
+def connect_to_db(config_params):
+    return psycopg2.connect(
+        host=config_params.HOST,
+        port=config_params.PORT,
+        dbname=config_params.DB_NAME,
+        user=config_params.USERNAME,
+        password=config_params.PASSWORD,
+    )
+
+
+def connect(backend=BACKEND):
+    """
+    Returns a connection to the database of `backend`. Both backends accept the same SQL and DB-API calls.
+
+    Args:
+    - backend: "postgres" or "duckdb", see `BACKEND`.
+    """
+
+    if backend == "duckdb":
+        from embedded_database import connect_to_duckdb
+
+        return connect_to_duckdb()
+    return connect_to_db(DBConfig())
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of at most `size` connections to the database of `backend`, opened when they are
+    first needed. A thread asking for a connection while all of them are in use waits for one to be
+    returned. With DuckDB every pooled connection is a cursor of a single in-process database, so the
+    dataset is only loaded once.
+
+    Args:
+    - size: Most connections open at the same time.
+    - backend: "postgres" or "duckdb", see `BACKEND`.
+    """
+
+    def __init__(self, size: int = POOL_SIZE, backend=BACKEND):
+        self.backend = backend
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.connections = []
+        self.database = None
+
+    def open_connection(self):
+        if self.backend != "duckdb":
+            return connect(self.backend)
+        with self.lock:
+            if self.database is None:
+                self.database = connect(self.backend)
+        return self.database.cursor()
+
+    @contextmanager
+    def connection(self):
+        """
+        Lends a connection for the duration of a `with` block. A Postgres transaction left open by the block
+        is rolled back, a connection that raised is closed instead of being reused.
+        """
+
+        self.slots.acquire()
+        try:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = self.open_connection()
+                with self.lock:
+                    self.connections.append(conn)
+
+            try:
+                yield conn
+            except BaseException:
+                with self.lock:
+                    self.connections.remove(conn)
+                conn.close()
+                raise
+
+            if self.backend != "duckdb":
+                conn.rollback()
+            self.idle.put(conn)
+        finally:
+            self.slots.release()
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+            if self.database is not None:
+                self.database.close()
+                self.database = None
@@ -0,0 +1,237 @@
+import os
+import shutil
+import tempfile
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+import tracing
+
+# ----------------------------
+# ---------- CONFIG ----------
+# ----------------------------
+
+# Bytes of row digests held in memory, the digests are spilled to partition files on disk beyond it
+MEMORY_BUDGET = 64 * 1024 * 1024
+
+# The first bits of a digest pick its partition, so that equal rows always end up in the same partition and
+# every partition is deduplicated on its own. With 2 ** 8 partitions, a partition outgrows `MEMORY_BUDGET`
+# beyond about 700 million rows.
+PARTITION_BITS = 8
+
+# Folder of the spilled partitions, the system temp folder by default
+SPILL_DIRECTORY = None
+
+# Rows hashed at a time, hashing a text column builds a table of its distinct values
+HASH_BATCH_ROWS = 100_000
+
+# Two independent 64 bit hashes of every row, the chance of two different rows getting the same 128 bit
+# digest is negligible even for billions of rows
+HASH_KEYS = ["0123456789123456", "fedcba9876543210"]
+
+# Digest and position in the input of every row
+ENTRY_DTYPE = np.dtype([("high", "<u8"), ("low", "<u8"), ("position", "<i8")])
+
+# ---------------------------
+# ---------- UTILS ----------
+# ---------------------------
+
+
+def get_digests(df: pd.DataFrame) -> tuple:
+    """
+    Returns the high and low 64 bits of the 128 bit digest of every row of `df`. Rows with the same values
+    get the same digest whatever their index, like `DataFrame.duplicated` compares them.
+    """
+
+    high, low = (
+        pd.util.hash_pandas_object(df, index=False, hash_key=hash_key).to_numpy() for hash_key in HASH_KEYS
+    )
+    return high, low
+
+
+def get_first_positions(entries: np.ndarray) -> np.ndarray:
+    """
+    Returns the positions of the first row of every distinct digest of `entries`, which are in the order of
+    their positions.
+    """
+
+    # stable, so that the entries of a digest stay in the order of their positions. Sorting by the high bits
+    # alone is enough unless two different digests share them, which then needs the slower sort by both.
+    entries = entries[np.argsort(entries["high"], kind="stable")]
+    same_high = entries["high"][1:] == entries["high"][:-1]
+    if np.any(same_high & (entries["low"][1:] != entries["low"][:-1])):
+        entries = entries[np.lexsort((entries["position"], entries["low"], entries["high"]))]
+        same_high = entries["high"][1:] == entries["high"][:-1]
+
+    is_first = np.ones(len(entries), dtype=bool)
+    is_first[1:] = ~(same_high & (entries["low"][1:] == entries["low"][:-1]))
+    return entries["position"][is_first]
+
+
+# -----------------------------------
+# ---------- DEDUPLICATION ----------
+# -----------------------------------
+
+
+class HashDeduplicator:
+    """
+    Drops duplicate rows of a table seen as one or more DataFrames (e.g. the chunks of a file), keeping the
+    first occurrence of every row like `DataFrame.drop_duplicates(keep="first")`, in a fixed amount of memory.
+
+    It works in two passes over the same rows in the same order. `add` keeps a 16 byte digest and the
+    position of every row, spilling them to partition files once they outgrow `memory_budget`. `finish`
+    deduplicates every partition on its own and marks the first position of every digest in a bitmap of one
+    bit per row and counts them in `kept_rows`. `drop_duplicates` then returns the marked rows of every
+    DataFrame. Partition files are deleted by `finish` or `close`.
+
+    Args:
+    - subset: Columns identifying a duplicate, all columns by default.
+    - memory_budget: Bytes of digests held in memory before they are spilled.
+    - spill_directory: Folder of the spilled partitions, see `SPILL_DIRECTORY`.
+    """
+
+    def __init__(
+        self,
+        subset: List[str] = None,
+        memory_budget: int = MEMORY_BUDGET,
+        spill_directory: str = SPILL_DIRECTORY,
+    ):
+        self.subset = subset
+        self.memory_budget = memory_budget
+        self.spill_directory = spill_directory
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.partition_directory = None
+        self.rows = 0
+        self.keep_bits = None
+        self.kept_rows = None
+        self.position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, df: pd.DataFrame):
+        """
+        First pass: records the digest of every row of `df`.
+        """
+
+        if self.keep_bits is not None:
+            raise RuntimeError("Rows can only be added before `finish`.")
+
+        keys = df if self.subset is None else df[self.subset]
+        for start in range(0, len(keys), HASH_BATCH_ROWS):
+            high, low = get_digests(keys.iloc[start : start + HASH_BATCH_ROWS])
+            entries = np.empty(len(high), dtype=ENTRY_DTYPE)
+            entries["high"], entries["low"] = high, low
+            entries["position"] = np.arange(self.rows, self.rows + len(high))
+            self.rows += len(high)
+
+            self.buffer.append(entries)
+            self.buffered_bytes += entries.nbytes
+            if self.buffered_bytes > self.memory_budget:
+                self.spill()
+
+    def spill(self):
+        """
+        Appends the buffered digests to the file of their partition.
+        """
+
+        if self.partition_directory is None:
+            self.partition_directory = tempfile.mkdtemp(prefix="dedup_", dir=self.spill_directory)
+
+        entries = np.concatenate(self.buffer)
+        self.buffer, self.buffered_bytes = [], 0
+
+        with tracing.span("spill", "write", path=self.partition_directory) as record:
+            partitions = entries["high"] >> np.uint64(64 - PARTITION_BITS)
+            # stable, so that every partition file stays in the order of the positions
+            order = np.argsort(partitions, kind="stable")
+            bounds = np.searchsorted(partitions[order], np.arange(2**PARTITION_BITS + 1))
+            for partition in range(2**PARTITION_BITS):
+                part = entries[order[bounds[partition] : bounds[partition + 1]]]
+                if len(part):
+                    with open(self.get_partition_path(partition), "ab") as file:
+                        part.tofile(file)
+            record["rows_in"] = len(entries)
+            record["bytes_written"] = entries.nbytes
+
+    def get_partition_path(self, partition: int) -> str:
+        return os.path.join(self.partition_directory, f"partition_{partition:04d}.bin")
+
+    def finish(self):
+        """
+        Ends the first pass: finds the first occurrence of every digest, one partition at a time.
+        """
+
+        keep_bits = np.zeros((self.rows + 7) // 8, dtype=np.uint8)
+
+        def mark(positions):
+            np.bitwise_or.at(keep_bits, positions >> 3, (1 << (positions & 7)).astype(np.uint8))
+
+        with tracing.span("finish", "dedup", rows_in=self.rows) as record:
+            if self.partition_directory is None:
+                if self.buffer:
+                    mark(get_first_positions(np.concatenate(self.buffer)))
+            else:
+                if self.buffer:
+                    self.spill()
+                for partition in range(2**PARTITION_BITS):
+                    path = self.get_partition_path(partition)
+                    if os.path.exists(path):
+                        mark(get_first_positions(np.fromfile(path, dtype=ENTRY_DTYPE)))
+                        record["bytes_read"] = record.get("bytes_read", 0) + tracing.get_file_size(path)
+            self.kept_rows = int(np.unpackbits(keep_bits, count=self.rows, bitorder="little").sum())
+            record["rows_out"] = self.kept_rows
+
+        self.buffer, self.buffered_bytes = [], 0
+        self.keep_bits = keep_bits
+        self.close()
+
+    def get_keep_mask(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Second pass: returns whether every row of `df` is the first occurrence of its values. Every DataFrame
+        of the first pass is passed again, in the same order.
+        """
+
+        if self.keep_bits is None:
+            raise RuntimeError("`finish` has to be called before the duplicates are dropped.")
+        if self.position + len(df) > self.rows:
+            raise ValueError(f"More rows than the {self.rows} rows added in the first pass.")
+
+        first_byte, offset = divmod(self.position, 8)
+        keep_bytes = self.keep_bits[first_byte : (self.position + len(df) + 7) // 8]
+        keep = np.unpackbits(keep_bytes, bitorder="little")[offset : offset + len(df)]
+        self.position += len(df)
+        return keep.astype(bool)
+
+    def drop_duplicates(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Second pass: returns the rows of `df` that are the first occurrence of their values, see
+        `get_keep_mask`.
+        """
+
+        # take returns a new DataFrame rather than a slice of `df`, so the caller can modify it
+        return df.take(np.flatnonzero(self.get_keep_mask(df)))
+
+    def close(self):
+        if self.partition_directory is not None:
+            shutil.rmtree(self.partition_directory, ignore_errors=True)
+            self.partition_directory = None
+
+
+def drop_duplicates(
+    df: pd.DataFrame, subset: List[str] = None, memory_budget: int = MEMORY_BUDGET
+) -> pd.DataFrame:
+    """
+    `DataFrame.drop_duplicates(subset, keep="first")` of a whole DataFrame with a `HashDeduplicator`: only
+    the digests of the rows are held, in at most `memory_budget` bytes, instead of a hash table of the values.
+    """
+
+    with HashDeduplicator(subset, memory_budget) as deduplicator:
+        deduplicator.add(df)
+        deduplicator.finish()
+        return deduplicator.drop_duplicates(df)
@@ -0,0 +1,43 @@
+-- Columns of the tables derived from other columns, so that analyze_data.py reads them instead of computing
+-- them on every query. Run by load_data.derive_columns after every load, only rows whose value changed are
+-- written.
+
+-- Season of every game and the date its ages are counted from: the start_date, or 01-01-XXXX or 07-01-XXXX
+-- (MM-DD-YYYY) for winter/summer games without one
+UPDATE game AS g
+SET season = derived.season, effective_start_date = derived.effective_start_date
+FROM (
+	SELECT
+		game_id,
+		CASE
+			WHEN title LIKE '%Summer%' THEN 'Summer'
+			WHEN title LIKE '%Winter%' THEN 'Winter'
+		END AS season,
+		CASE
+			WHEN start_date IS NOT NULL THEN start_date
+			WHEN title ILIKE '%Wint%' THEN MAKE_DATE(year, 1, 1)
+			WHEN title ILIKE '%Sum%' THEN MAKE_DATE(year, 7, 1)
+		END AS effective_start_date
+	FROM game
+) AS derived
+WHERE g.game_id = derived.game_id
+AND (g.season, g.effective_start_date) IS DISTINCT FROM (derived.season, derived.effective_start_date);
+
+-- Age of the athlete at the game of every result in years. The age is counted in days like psycopg2 converts
+-- intervals (365 days per year, 30 per month), so that it does not depend on the driver.
+UPDATE "result" AS r
+SET age_at_game = derived.age_at_game
+FROM (
+	SELECT
+		result_id,
+		(EXTRACT(YEAR FROM age) * 365 + EXTRACT(MONTH FROM age) * 30 + EXTRACT(DAY FROM age)) / 365.0
+			AS age_at_game
+	FROM (
+		SELECT res.result_id, AGE(g.effective_start_date, a.date_of_birth) AS age
+		FROM "result" AS res
+		JOIN athlete AS a ON res.athlete_id = a.athlete_id
+		JOIN game AS g ON res.game_id = g.game_id
+	) AS athlete_age
+) AS derived
+WHERE r.result_id = derived.result_id
+AND r.age_at_game IS DISTINCT FROM derived.age_at_game;
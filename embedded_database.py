@@ -0,0 +1,115 @@
+import os
+import re
+import time
+from typing import List
+
+from format_csv_files import CSV_NAMES, DATASET_PATH, PARQUET_NAMES
+from load_data import DERIVED_COLUMNS_PATH, LOAD_ORDER, SCHEMA_PATH, TABLES, VIEWS_PATH
+
+# ----------------------------
+# ---------- CONFIG ----------
+# ----------------------------
+
+
+class DuckDBConfig:
+    # ":memory:" builds the database from the dataset files on every connection, a file path keeps it
+    # between runs (delete the file to load a new dataset)
+    DATABASE = ":memory:"
+    DATASET_PATH = DATASET_PATH
+
+
+# ---------------------------
+# ---------- UTILS ----------
+# ---------------------------
+
+
+def read_sql_statements(path: str) -> List[str]:
+    with open(path) as file:
+        script = re.sub(r"--[^\n]*", "", file.read())
+    return [statement.strip() for statement in script.split(";") if statement.strip()]
+
+
+def to_duckdb_statement(statement: str):
+    """
+    Translates a statement of the Postgres schema files to DuckDB. Returns None for the statements DuckDB
+    does not need: the indexes only speed up Postgres, DuckDB scans the columns it needs anyway.
+    """
+
+    if re.match(r"CREATE\s+(UNIQUE\s+)?INDEX", statement, re.IGNORECASE):
+        return None
+    # A materialized view is a table filled once by its query, refreshed by rebuilding the database
+    return re.sub(r"^CREATE\s+MATERIALIZED\s+VIEW", "CREATE TABLE", statement, flags=re.IGNORECASE)
+
+
+def quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def get_table_source(name: str, dataset_path: str) -> str:
+    """
+    Returns the DuckDB table function reading a formatted table, preferring its typed Parquet copy over the
+    CSV file. CSV columns are read as text and cast by the insert like Postgres COPY does, empty fields
+    become NULL.
+    """
+
+    parquet_path = os.path.join(dataset_path, PARQUET_NAMES[name])
+    if os.path.exists(parquet_path):
+        return f"read_parquet({quote_literal(parquet_path)})"
+
+    csv_path = os.path.join(dataset_path, CSV_NAMES[name])
+    return f"read_csv({quote_literal(csv_path)}, header = true, all_varchar = true)"
+
+
+# ------------------------------------
+# ---------- DUCKDB BACKEND ----------
+# ------------------------------------
+
+
+def load_duckdb_table(conn, name: str, dataset_path: str):
+    table, columns = TABLES[name]
+    column_list = ", ".join(f'"{column}"' for column in columns)
+
+    start = time.perf_counter()
+    conn.execute(
+        f'INSERT INTO "{table}" ({column_list}) '
+        f"SELECT {column_list} FROM {get_table_source(name, dataset_path)}"
+    )
+    rows = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    print(f"Loaded {rows} rows into '{table}' in {time.perf_counter() - start:.2f}s")
+
+
+def connect_to_duckdb(config_params=DuckDBConfig):
+    """
+    Returns an in-process DuckDB connection with the tables of `SCHEMA_PATH` and the views of `VIEWS_PATH`,
+    filled from the formatted dataset files and the updates of `DERIVED_COLUMNS_PATH`. The analysis functions
+    of analyze_data.py run on it like on the Postgres database, without a server.
+
+    Args:
+    - config_params: DuckDBConfig with the database file and the folder of the formatted dataset.
+    """
+
+    import duckdb
+
+    conn = duckdb.connect(config_params.DATABASE)
+
+    existing_tables = {row[0] for row in conn.execute("SELECT table_name FROM duckdb_tables()").fetchall()}
+    if all(TABLES[name][0] in existing_tables for name in LOAD_ORDER):
+        return conn
+
+    for statement in read_sql_statements(SCHEMA_PATH):
+        statement = to_duckdb_statement(statement)
+        if statement is not None:
+            conn.execute(statement)
+
+    for name in LOAD_ORDER:
+        load_duckdb_table(conn, name, config_params.DATASET_PATH)
+
+    for statement in read_sql_statements(DERIVED_COLUMNS_PATH):
+        conn.execute(statement)
+
+    for statement in read_sql_statements(VIEWS_PATH):
+        statement = to_duckdb_statement(statement)
+        if statement is not None:
+            conn.execute(statement)
+
+    return conn
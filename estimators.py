@@ -0,0 +1,81 @@
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+# Estimators of the approximate mode of analyze_data.py: means from the stratified sample of the age_sample
+# view, see create_views.sql. Every estimate comes with the half-width of its error bound.
+
+# ----------------------------
+# ---------- CONFIG ----------
+# ----------------------------
+
+# Standard errors per error bound, 1.96 bounds about 95% of the estimates
+CONFIDENCE_Z = 1.96
+
+# --------------------------------------
+# ---------- STRATIFIED MEANS ----------
+# --------------------------------------
+
+
+def estimate_means(
+    sample: pd.DataFrame, by: List[str], value: str, strata: List[str], stratum_rows: str = "stratum_rows"
+) -> pd.DataFrame:
+    """
+    Estimates the mean of `value` per group of `by` from a stratified sample. Every sampled row stands for
+    the rows of its stratum it was drawn from, so groups cutting across the strata (e.g. gender) are weighted
+    accordingly. The error bound comes from the variance of the ratio estimator within every stratum, with
+    the finite population correction, so complete strata add no error. Returns a DataFrame with the columns
+    of `by`, mean and error.
+
+    Args:
+    - sample: Sampled rows, with all sampled rows of every stratum it contains.
+    - by: Columns to group by.
+    - value: Column to average.
+    - strata: Columns of the strata the rows were sampled from.
+    - stratum_rows: Column with the number of rows of the stratum of every sampled row.
+    """
+
+    sample = sample.assign(
+        sampled_rows=sample.groupby(strata, dropna=False, observed=True)[value].transform("size"),
+        squared=sample[value] ** 2,
+    )
+    parts = (
+        sample.groupby(list(dict.fromkeys(by + strata)), dropna=False, observed=True)
+        .agg(
+            count=(value, "size"),
+            total=(value, "sum"),
+            squared_total=("squared", "sum"),
+            sampled_rows=("sampled_rows", "first"),
+            stratum_rows=(stratum_rows, "first"),
+        )
+        .reset_index()
+    )
+    # in floats, the squared row counts overflow the small integer types of compacted columns
+    parts = parts.astype({"count": "float64", "sampled_rows": "float64", "stratum_rows": "float64"})
+    parts["weight"] = parts["stratum_rows"] / parts["sampled_rows"]
+    parts["weighted_count"] = parts["count"] * parts["weight"]
+    parts["weighted_total"] = parts["total"] * parts["weight"]
+
+    groups = (
+        parts.groupby(by, dropna=False, observed=True)[["weighted_count", "weighted_total"]].sum().reset_index()
+    )
+    groups["mean"] = groups["weighted_total"] / groups["weighted_count"]
+
+    # linearized ratio estimator: per stratum the sum and the sum of squares of (value - mean) / estimated
+    # rows over the rows of the group, its other sampled rows add 0
+    parts = parts.merge(groups[by + ["mean", "weighted_count"]], on=by, suffixes=("", "_group"))
+    mean, rows = parts["mean"], parts["weighted_count_group"]
+    deviation = (parts["total"] - mean * parts["count"]) / rows
+    squared_deviation = (
+        parts["squared_total"] - 2 * mean * parts["total"] + mean**2 * parts["count"]
+    ) / rows**2
+
+    n, population = parts["sampled_rows"], parts["stratum_rows"]
+    stratum_variance = ((squared_deviation - deviation**2 / n) / (n - 1)).where(n > 1, 0.0).clip(lower=0)
+    parts["variance"] = population**2 * (1 - n / population) * stratum_variance / n
+
+    variance = parts.groupby(by, dropna=False, observed=True)["variance"].sum().reset_index()
+    groups = groups.merge(variance, on=by)
+    groups["error"] = CONFIDENCE_Z * np.sqrt(groups["variance"])
+    return groups[by + ["mean", "error"]]
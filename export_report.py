@@ -0,0 +1,181 @@
+import html
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import matplotlib
+
+# Figures are only rendered to files, no display is needed
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+
+import tracing
+from analyze_data import REPORT, run_report
+from database import BACKEND, ConnectionPool
+
+# ----------------------------
+# ---------- CONFIG ----------
+# ----------------------------
+
+EXPORT_DIRECTORY = "./report"
+
+# Any format matplotlib can save, the first one is shown by the index page
+EXPORT_FORMATS = ["png", "svg"]
+
+EXPORT_DPI = 100
+
+# Render processes, None uses one per CPU
+RENDER_WORKERS = None
+
+# ---------------------------
+# ---------- UTILS ----------
+# ---------------------------
+
+
+def get_figure_title(figure) -> str:
+    titles = [axes.get_title() for axes in figure.axes if axes.get_title()]
+    return " / ".join(titles)
+
+
+def render_analysis(name: str, data, output_directory: str, formats: List[str]) -> tuple:
+    """
+    Runs the plot function of an analysis of `REPORT` on the non-interactive backend and saves every figure
+    it opened. Runs in a worker process and returns the manifest entries of the figures, with the seconds the
+    plot function took for all of them and the seconds every figure took to save, and the spans of the worker
+    for the trace of the parent, see `tracing.collect_spans`.
+
+    Args:
+    - name: Name of the analysis in `REPORT`.
+    - data: Data returned by the query function of the analysis.
+    - output_directory: Folder the files are written to.
+    - formats: File formats of every figure.
+    """
+
+    start = time.perf_counter()
+    plt.close("all")
+    with warnings.catch_warnings():
+        # plt.show() does nothing on the Agg backend
+        warnings.filterwarnings("ignore", message=".*non-interactive.*")
+        REPORT[name][1](data)
+    # the plot function draws all figures of the analysis at once
+    plot_seconds = round(time.perf_counter() - start, 3)
+
+    figures = []
+    for index, number in enumerate(plt.get_fignums(), start=1):
+        start = time.perf_counter()
+        figure = plt.figure(number)
+        files = []
+        for file_format in formats:
+            file_name = f"{name}_{index}.{file_format}"
+            path = os.path.join(output_directory, file_name)
+            with tracing.span(file_name, "write", path=path) as record:
+                figure.savefig(path, format=file_format, dpi=EXPORT_DPI)
+                record["bytes_written"] = tracing.get_file_size(path)
+            files.append(file_name)
+        figures.append(
+            {
+                "analysis": name,
+                "title": get_figure_title(figure),
+                "files": files,
+                "plot_seconds": plot_seconds,
+                "save_seconds": round(time.perf_counter() - start, 3),
+            }
+        )
+    plt.close("all")
+
+    return figures, tracing.collect_spans()
+
+
+def write_index(output_directory: str, figures: List[dict]):
+    """
+    Writes an index.html showing every figure of the manifest, grouped by analysis.
+    """
+
+    sections = []
+    for name in dict.fromkeys(figure["analysis"] for figure in figures):
+        images = "\n".join(
+            f'<figure><img src="{html.escape(figure["files"][0])}" alt="{html.escape(figure["title"])}">'
+            f'<figcaption>{html.escape(figure["title"])} '
+            + " ".join(f'<a href="{html.escape(file)}">{html.escape(file)}</a>' for file in figure["files"])
+            + "</figcaption></figure>"
+            for figure in figures
+            if figure["analysis"] == name
+        )
+        sections.append(f"<h2>{html.escape(name)}</h2>\n{images}")
+
+    page = (
+        '<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>Olympic Games Report</title>\n'
+        "<style>img { max-width: 100%; } figure { margin: 0 0 2em 0; }</style></head>\n<body>\n"
+        "<h1>Olympic Games Report</h1>\n" + "\n".join(sections) + "\n</body>\n</html>\n"
+    )
+    with open(os.path.join(output_directory, "index.html"), "w") as file:
+        file.write(page)
+
+
+# ------------------------------------
+# ---------- REPORT EXPORT ----------
+# ------------------------------------
+
+
+def export_report(
+    pool: ConnectionPool,
+    output_directory: str = EXPORT_DIRECTORY,
+    formats: List[str] = EXPORT_FORMATS,
+    workers: int = RENDER_WORKERS,
+) -> List[dict]:
+    """
+    Renders every figure of the analyses of `REPORT` to files without a display: the queries run
+    concurrently on `pool`, then every analysis is plotted in its own worker process. Writes a
+    manifest.json listing the figures and an index.html showing them. Returns the manifest entries.
+
+    Args:
+    - pool: ConnectionPool to run the queries on.
+    - output_directory: Folder the figures, manifest and index page are written to.
+    - formats: File formats of every figure, see `EXPORT_FORMATS`.
+    - workers: Number of render processes.
+    """
+
+    start = time.perf_counter()
+    os.makedirs(output_directory, exist_ok=True)
+
+    # Queries only, the plots are rendered by the worker processes
+    plotted = [name for name, (_, plot) in REPORT.items() if plot is not None]
+    data = run_report(pool, {name: (REPORT[name][0], None) for name in plotted})
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(render_analysis, name, data[name], output_directory, formats) for name in plotted
+        ]
+        figures = []
+        for future in futures:
+            analysis_figures, spans = future.result()
+            tracing.add_spans(spans)
+            figures.extend(analysis_figures)
+
+    with open(os.path.join(output_directory, "manifest.json"), "w") as file:
+        json.dump({"formats": formats, "figures": figures}, file, indent=2)
+    write_index(output_directory, figures)
+
+    print(
+        f"Exported {len(figures)} figures to '{output_directory}' in {time.perf_counter() - start:.2f}s"
+    )
+    return figures
+
+
+def main(
+    output_directory: str = EXPORT_DIRECTORY,
+    formats: List[str] = EXPORT_FORMATS,
+    backend: str = BACKEND,
+):
+    pool = ConnectionPool(backend=backend)
+    export_report(pool, output_directory, formats)
+    pool.close()
+
+
+if __name__ == "__main__":
+
+    main()
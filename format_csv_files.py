@@ -1,16 +1,25 @@
+import itertools
 import os
-import re
 import shutil
-import kagglehub
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
 import pandas as pd
 from typing import List
 
+import dedup
+import stage_cache
+import tracing
+from cleaning import extract_first_int, null_unless_in, parse_dates, stable_row_ids
+
 # ----------------------------
 # ---------- CONFIG ----------
 # ----------------------------
 
 DATASET_URL = "josephcheng123456/olympic-historical-dataset-from-olympediaorg"
 
+# Folder with the raw source files to format instead of downloading them, e.g. written by generate_dataset.py
+SOURCE_DIRECTORY = None
+
 BASE_DIRECTORY = "./"
 DATASET_FOLDER = "dataset"
 DATASET_PATH = f"{BASE_DIRECTORY}{DATASET_FOLDER}"
@@ -26,11 +35,65 @@ CSV_NAMES = {
     "Result": "result.csv",
 }
 
+SOURCE_NAMES = {
+    "Athlete": "Olympic_Athlete_Bio.csv",
+    "Country": "Olympics_Country.csv",
+    "Event": "Olympic_Athlete_Event_Results.csv",
+    "Game": "Olympics_Games.csv",
+}
+
+PARQUET_NAMES = {name: csv_name.replace(".csv", ".parquet") for name, csv_name in CSV_NAMES.items()}
+
+# "csv" is always needed for the Postgres COPY path, "parquet" adds typed columnar copies of the tables
+OUTPUT_FORMATS = ["csv"]
+
+# "pipeline" formats everything in memory in a single pass, "parallel" runs the stages of the pipeline on
+# `MAX_WORKERS` processes, "staged" formats the CSV files one stage at a time and "streaming" formats the
+# source files in chunks of `CHUNK_SIZE` rows
+FORMAT_MODE = "pipeline"
+CHUNK_SIZE = 100_000
+MAX_WORKERS = None
+
+# Formatting stages of the pipeline, each one formats the table of the same name from source files and
+# tables formatted by other stages. Increase a stage's version whenever its output changes, so that its
+# cached output is no longer used.
+STAGES = {
+    "Country": {"sources": ["Country"], "tables": [], "version": 1},
+    "Athlete": {"sources": ["Athlete"], "tables": [], "version": 2},
+    "Game": {"sources": ["Game"], "tables": [], "version": 1},
+    "Result": {"sources": ["Event"], "tables": ["Athlete"], "version": 4},
+    "Sport": {"sources": ["Event"], "tables": [], "version": 2},
+    "Event": {"sources": ["Event"], "tables": ["Sport"], "version": 2},
+}
+
+USE_STAGE_CACHE = True
+
+# Columns of a result identifying it along with its number among the results of the same key, so that a
+# corrected position updates the result rather than replacing it
+RESULT_KEY = ["game_id", "event_id", "athlete_id"]
+
+# Formats of the dates of the source files, tried in order. Other values, like a year alone, become empty.
+DATE_FORMATS = ["%d %B %Y"]
+
+# Column types of the source files, so that every chunk is parsed the same way a whole file would be
+SOURCE_DTYPES = {
+    "Athlete": {"athlete_id": "int64", "height": "float64", "weight": "object"},
+    "Country": {},
+    "Event": {
+        "edition_id": "int64",
+        "result_id": "int64",
+        "athlete_id": "int64",
+        "pos": "object",
+        "isTeamSport": "bool",
+    },
+    "Game": {"edition_id": "int64", "year": "int64"},
+}
+
 CSV_NAME_MAPPING = {
-    "Olympic_Athlete_Bio.csv": CSV_NAMES["Athlete"],
-    "Olympics_Country.csv": CSV_NAMES["Country"],
-    "Olympic_Athlete_Event_Results.csv": CSV_NAMES["Event"],
-    "Olympics_Games.csv": CSV_NAMES["Game"],
+    SOURCE_NAMES["Athlete"]: CSV_NAMES["Athlete"],
+    SOURCE_NAMES["Country"]: CSV_NAMES["Country"],
+    SOURCE_NAMES["Event"]: CSV_NAMES["Event"],
+    SOURCE_NAMES["Game"]: CSV_NAMES["Game"],
 }
 
 # ---------------------------
@@ -120,19 +183,255 @@ def rename_columns(df: pd.DataFrame, rename_mapping: dict):
     print(f"Columns have been renamed: {rename_mapping}")
 
 
+def read_csv(path: str, **kwargs) -> pd.DataFrame:
+    """
+    `pd.read_csv` in a "read" span of the trace.
+    """
+
+    with tracing.span(os.path.basename(path), "read", path=path) as record:
+        df = pd.read_csv(path, **kwargs)
+        record["rows_out"] = len(df)
+        record["bytes_read"] = tracing.get_file_size(path)
+    return df
+
+
+def write_csv(df: pd.DataFrame, path: str, **kwargs):
+    """
+    `df.to_csv` without the index in a "write" span of the trace.
+    """
+
+    with tracing.span(os.path.basename(path), "write", path=path) as record:
+        size = tracing.get_file_size(path) if kwargs.get("mode") == "a" else 0
+        df.to_csv(path, index=False, **kwargs)
+        record["rows_in"] = len(df)
+        record["bytes_written"] = tracing.get_file_size(path) - size
+
+
+def get_parquet_schemas() -> dict:
+    """
+    Returns the pyarrow schema of every table keyed like `CSV_NAMES`. Repeated strings are dictionary encoded.
+    """
+
+    import pyarrow as pa
+
+    category = pa.dictionary(pa.int32(), pa.string())
+
+    return {
+        "Athlete": pa.schema(
+            [
+                ("athlete_id", pa.int32()),
+                ("name", pa.string()),
+                ("gender", category),
+                ("date_of_birth", pa.date32()),
+                ("height", pa.float32()),
+                ("weight", pa.float32()),
+                ("country_id", category),
+            ]
+        ),
+        "Country": pa.schema(
+            [
+                ("country_id", pa.string()),
+                ("name", pa.string()),
+            ]
+        ),
+        "Event": pa.schema(
+            [
+                ("event_id", pa.int32()),
+                ("name", category),
+                ("gender", category),
+                ("is_team_event", pa.bool_()),
+                ("sport_id", pa.int32()),
+            ]
+        ),
+        "Game": pa.schema(
+            [
+                ("game_id", pa.int32()),
+                ("title", pa.string()),
+                ("year", pa.int16()),
+                ("city", category),
+                ("start_date", pa.date32()),
+                ("end_date", pa.date32()),
+                ("was_held", pa.bool_()),
+                ("country_id", category),
+            ]
+        ),
+        "Sport": pa.schema(
+            [
+                ("sport_id", pa.int32()),
+                ("name", pa.string()),
+            ]
+        ),
+        "Result": pa.schema(
+            [
+                ("result_id", pa.int64()),
+                ("position", category),
+                ("game_id", pa.int32()),
+                ("event_id", pa.int32()),
+                ("athlete_id", pa.int32()),
+            ]
+        ),
+    }
+
+
+def to_arrow_table(df: pd.DataFrame, schema):
+    import pyarrow as pa
+
+    arrays = []
+    for field in schema:
+        column = df[field.name]
+
+        # Empty strings are loaded as NULL by Postgres COPY, keep them null here as well
+        if column.dtype == object:
+            column = column.mask(column == "")
+
+        # Cast column by column so every table is stored with the exact same types
+        arrays.append(pa.array(column, from_pandas=True).cast(field.type))
+
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def write_parquet(df: pd.DataFrame, path: str, schema):
+    import pyarrow.parquet as pq
+
+    with tracing.span(os.path.basename(path), "write", path=path) as record:
+        pq.write_table(to_arrow_table(df, schema), path)
+        record["rows_in"] = len(df)
+        record["bytes_written"] = tracing.get_file_size(path)
+
+
+def read_table(name: str) -> pd.DataFrame:
+    """
+    Reads a formatted table, preferring its typed Parquet copy over the CSV file.
+
+    Args:
+    - name: Key of the table in `CSV_NAMES`.
+    """
+
+    parquet_path = os.path.join(DATASET_PATH, PARQUET_NAMES[name])
+    if os.path.exists(parquet_path):
+        with tracing.span(PARQUET_NAMES[name], "read", path=parquet_path) as record:
+            df = pd.read_parquet(parquet_path)
+            record["rows_out"] = len(df)
+            record["bytes_read"] = tracing.get_file_size(parquet_path)
+        return df
+
+    import pyarrow as pa
+
+    date_columns = [
+        field.name
+        for field in get_parquet_schemas()[name]
+        if field.type == pa.date32()
+    ]
+    return read_csv(
+        os.path.join(DATASET_PATH, CSV_NAMES[name]), parse_dates=date_columns
+    )
+
+
+class ResultDeduplicator:
+    """
+    Drops the duplicate rows of the raw athlete event results chunk by chunk like `dedup.HashDeduplicator`,
+    in two passes over the same chunks, and numbers the remaining results of every `RESULT_KEY` in the order
+    of the rows, like `transform_results` does for a whole table. Only the keys with more than one result
+    are held in memory.
+
+    Args:
+    - columns: Raw names of the columns of a result.
+    - key_columns: Raw names of the columns of `RESULT_KEY`.
+    """
+
+    def __init__(self, columns: List[str], key_columns: List[str]):
+        self.row_deduplicator = dedup.HashDeduplicator(columns)
+        self.key_deduplicator = dedup.HashDeduplicator(key_columns)
+        # last number given to every key with more than one result
+        self.last_ordinals = {}
+
+    def add(self, df: pd.DataFrame):
+        self.row_deduplicator.add(df)
+        self.key_deduplicator.add(df)
+
+    def finish(self):
+        self.row_deduplicator.finish()
+        self.key_deduplicator.finish()
+
+    def close(self):
+        self.row_deduplicator.close()
+        self.key_deduplicator.close()
+
+    def drop_duplicates(self, df: pd.DataFrame) -> tuple:
+        """
+        Second pass: returns the rows of the formatted results `df` that are the first occurrence of their
+        values, and the number of every row among the results of its key.
+        """
+
+        keep = self.row_deduplicator.get_keep_mask(df)
+        # the first row of a key is also the first row of its values, so it is kept
+        is_first_of_key = self.key_deduplicator.get_keep_mask(df)[keep]
+        df = df.take(np.flatnonzero(keep))
+
+        ordinals = np.zeros(len(df), dtype="int64")
+        keys = df[RESULT_KEY].to_numpy()
+        for position in np.flatnonzero(~is_first_of_key):
+            key = tuple(keys[position])
+            ordinals[position] = self.last_ordinals.get(key, 0) + 1
+            self.last_ordinals[key] = ordinals[position]
+        return df, pd.Series(ordinals, index=df.index)
+
+
+class TableWriter:
+    """
+    Writes a formatted table chunk by chunk in every output format.
+
+    Args:
+    - name: Key of the table in `CSV_NAMES`.
+    - output_formats: Any of "csv" and "parquet".
+    """
+
+    def __init__(self, name: str, output_formats: List[str] = OUTPUT_FORMATS):
+        self.name = name
+        self.output_formats = output_formats
+        self.rows = 0
+        self.parquet_writer = None
+
+    def write(self, df: pd.DataFrame):
+        if "csv" in self.output_formats:
+            path = os.path.join(DATASET_PATH, CSV_NAMES[self.name])
+            write_csv(df, path, mode="w" if self.rows == 0 else "a", header=self.rows == 0)
+
+        if "parquet" in self.output_formats:
+            import pyarrow.parquet as pq
+
+            schema = get_parquet_schemas()[self.name]
+            path = os.path.join(DATASET_PATH, PARQUET_NAMES[self.name])
+            with tracing.span(PARQUET_NAMES[self.name], "write", path=path) as record:
+                size = tracing.get_file_size(path) if self.parquet_writer is not None else 0
+                if self.parquet_writer is None:
+                    self.parquet_writer = pq.ParquetWriter(path, schema)
+                self.parquet_writer.write_table(to_arrow_table(df, schema))
+                # row groups still buffered by the writer are counted by a later write
+                record["rows_in"] = len(df)
+                record["bytes_written"] = tracing.get_file_size(path) - size
+
+        self.rows += len(df)
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        print(f"Written: {self.name} ({self.rows} rows)")
+
+
 def download_dataset():
+    # imported here as it is slow to import and only needed for the download
+    import kagglehub
+
     return kagglehub.dataset_download(DATASET_URL)
 
 
-# ------------------------------------
-# ---------- CSV FORMATTING ----------
-# ------------------------------------
+# ----------------------------------------
+# ---------- DATAFRAME TRANSFORMS ----------
+# ----------------------------------------
 
 
-def format_countries():
-    path = os.path.join(DATASET_PATH, CSV_NAMES["Country"])
-    df = pd.read_csv(path)
-
+def transform_countries(df: pd.DataFrame) -> pd.DataFrame:
     rename_columns(
         df,
         {
@@ -144,15 +443,12 @@ def format_countries():
     # Delete duplicate key for "Russian Olympic Committee"
     df = df[df["name"] != "ROC"]
 
-    df.to_csv(path, index=False)
-
+    return df
 
-def format_athletes():
-    path = os.path.join(DATASET_PATH, CSV_NAMES["Athlete"])
-    df = pd.read_csv(path)
 
+def transform_athletes(df: pd.DataFrame) -> pd.DataFrame:
     # Format dates
-    df["born"] = df["born"] = pd.to_datetime(df["born"], errors="coerce", dayfirst=True)
+    df["born"] = parse_dates(df["born"], DATE_FORMATS)
 
     # Delete unnecessary columns
     delete_columns(df, ["country", "description", "special_notes"])
@@ -167,36 +463,23 @@ def format_athletes():
         },
     )
 
-    # Clean and fix the weight column
-    def clean_weight(value):
-        if pd.isna(value):
-            return None  # Handle NaN
-        match = re.search(r"\d+", str(value))  # Extract the first number
-        return int(match.group()) if match else None
-
     # Replace " International Federation Representative  Italy"
     df["country_id"] = df["country_id"].replace("IFR", "ITA")
 
-    df["weight"] = df["weight"].apply(clean_weight)
-
-    df.to_csv(path, index=False)
+    # Clean and fix the weight column, only the first number is kept
+    df["weight"] = extract_first_int(df["weight"])
 
+    return df
 
-def format_games():
-    path = os.path.join(DATASET_PATH, CSV_NAMES["Game"])
-    df = pd.read_csv(path)
 
+def transform_games(df: pd.DataFrame) -> pd.DataFrame:
     # Strip leading/trailing spaces
     df["start_date"] = df["start_date"].astype(str).str.strip()
     df["end_date"] = df["end_date"].astype(str).str.strip()
 
     # Combine and convert to datetime
-    df["start_date"] = pd.to_datetime(
-        df["start_date"] + " " + df["year"].astype(str), errors="coerce", dayfirst=True
-    )
-    df["end_date"] = pd.to_datetime(
-        df["end_date"] + " " + df["year"].astype(str), errors="coerce", dayfirst=True
-    )
+    df["start_date"] = parse_dates(df["start_date"] + " " + df["year"].astype(str), DATE_FORMATS)
+    df["end_date"] = parse_dates(df["end_date"] + " " + df["year"].astype(str), DATE_FORMATS)
 
     delete_columns(df, ["edition_url", "country_flag_url", "competition_date"])
 
@@ -223,15 +506,27 @@ def format_games():
         str
     ).str.strip().ne("")
 
-    df.to_csv(path, index=False)
+    return df
 
 
-def format_results():
-    event_path = os.path.join(DATASET_PATH, CSV_NAMES["Event"])
-    result_path = os.path.join(DATASET_PATH, CSV_NAMES["Result"])
+def transform_results(
+    result_df: pd.DataFrame,
+    athlete_ids: pd.Series,
+    deduplicator: ResultDeduplicator = None,
+) -> pd.DataFrame:
+    """
+    Builds the result table from the raw athlete event results.
 
-    duplicate_file(event_path, result_path)
-    result_df = pd.read_csv(result_path)
+    The result_id of a result is derived from its game, event and athlete and, for an athlete with several
+    results in an event, from their order. It stays the same across runs, also when the position of the
+    result is corrected.
+
+    Args:
+    - result_df: Raw athlete event results, modified in place.
+    - athlete_ids: Ids of the formatted athletes, results of any other athlete are kept with an empty athlete_id.
+    - deduplicator: Finished deduplicator that has seen every chunk, when formatting the results chunk by
+      chunk, see `stream_event_results`.
+    """
 
     delete_columns(
         result_df,
@@ -247,49 +542,60 @@ def format_results():
         },
     )
 
-    # Delete duplicate rows
-    result_df.drop_duplicates(subset=None, keep="first", inplace=True)
+    # Delete duplicate rows, keeping the first one, and number the results of every key in their order
+    if deduplicator is None:
+        result_df = dedup.drop_duplicates(result_df)
+        ordinals = result_df.groupby(RESULT_KEY, dropna=False, sort=False).cumcount()
+    else:
+        result_df, ordinals = deduplicator.drop_duplicates(result_df)
 
-    # Add result_id column
-    result_df.insert(0, "result_id", range(len(result_df)))
+    # Add result_id column, computed before invalid athlete_ids are removed so that every row keeps its own id
+    result_df.insert(
+        0,
+        "result_id",
+        stable_row_ids(result_df[RESULT_KEY].assign(ordinal=ordinals), RESULT_KEY + ["ordinal"]),
+    )
+    if result_df["result_id"].duplicated().any():
+        raise ValueError("Different results were given the same result_id.")
 
     # Move position to second column
     gender_col = result_df.pop("position")
     result_df.insert(1, "position", gender_col)
 
     # For results with invalid athelete_ids
-    def replace_invalid_athelete_ids():
-        athlete_path = os.path.join(DATASET_PATH, CSV_NAMES["Athlete"])
-        athlete_df = pd.read_csv(athlete_path)
+    result_df["athlete_id"] = null_unless_in(result_df["athlete_id"], athlete_ids)
 
-        # Get set of valid athlete ids
-        valid_athlete_ids = set(athlete_df["athlete_id"])
+    return result_df
 
-        result_df["athlete_id"] = result_df["athlete_id"].apply(
-            lambda x: x if x in valid_athlete_ids else pd.NA
-        )
 
-    replace_invalid_athelete_ids()
+def transform_sports(df: pd.DataFrame, sports_mapping: dict = None):
+    """
+    Extracts the sport table from the raw athlete event results.
 
-    result_df.to_csv(result_path, index=False)
+    Returns a tuple of the sport table and the event results with the `sport` column replaced by `sport_id`.
+    The sport_id of a sport is derived from its name, so it stays the same across runs.
 
+    Args:
+    - df: Raw athlete event results, modified in place.
+    - sports_mapping: Sport ids assigned in previous chunks, extended in place with the new sports of `df`.
+    """
 
-def format_sports():
-    path = os.path.join(DATASET_PATH, CSV_NAMES["Event"])
-    df = pd.read_csv(path)
-
-    # Create a unique mapping for sports
-    unique_sports = df["sport"].unique()
-    sports_mapping = {sport: idx + 1 for idx, sport in enumerate(unique_sports)}
+    # Create a unique mapping for sports. The sport_id is derived from the name, so a sport keeps its id
+    # whatever rows the source has and in whatever order, and fits the INT column of the sport table.
+    if sports_mapping is None:
+        sports_mapping = {}
+    new_sports = pd.DataFrame(
+        {"name": [sport for sport in df["sport"].unique() if sport not in sports_mapping]}
+    )
+    new_ids = stable_row_ids(new_sports, ["name"]).to_numpy() >> 32
+    sports_mapping.update(zip(new_sports["name"], new_ids.tolist()))
+    if len(set(sports_mapping.values())) < len(sports_mapping):
+        raise ValueError("Different sports were given the same sport_id.")
 
     # Create a DataFrame for the sport mapping
     sports_df = pd.DataFrame(list(sports_mapping.items()), columns=["name", "sport_id"])
     sports_df = sports_df[["sport_id", "name"]].sort_values("sport_id")
 
-    # Save sport mappings to CSV file
-    sports_path = os.path.join(DATASET_PATH, CSV_NAMES["Sport"])
-    sports_df.to_csv(sports_path, index=False)
-
     # Replace sport column with corresponding id
     df["sport_id"] = df["sport"].map(sports_mapping)
     df.drop(columns=["sport"], inplace=True)
@@ -297,13 +603,12 @@ def format_sports():
     columns = [col for col in df.columns if col != "sport_id"] + ["sport_id"]
     df = df[columns]
 
-    df.to_csv(path, index=False)
+    return sports_df, df
 
 
-def format_events():
-    path = os.path.join(DATASET_PATH, CSV_NAMES["Event"])
-    df = pd.read_csv(path)
-
+def transform_events(
+    df: pd.DataFrame, deduplicator: dedup.HashDeduplicator = None
+) -> pd.DataFrame:
     delete_columns(
         df,
         [
@@ -327,7 +632,10 @@ def format_events():
     )
 
     # Drop all duplicate event_ids
-    df.drop_duplicates(subset=["event_id"], keep="first", inplace=True)
+    if deduplicator is None:
+        df = dedup.drop_duplicates(df, subset=["event_id"])
+    else:
+        df = deduplicator.drop_duplicates(df)
 
     # Move event_id to the first column
     columns = ["event_id"] + [col for col in df.columns if col != "event_id"]
@@ -348,21 +656,483 @@ def format_events():
     gender_col = df.pop("gender")
     df.insert(2, "gender", gender_col)
 
-    df.to_csv(path, index=False)
+    return df
 
 
-def main():
+# ------------------------------------
+# ---------- CSV FORMATTING ----------
+# ------------------------------------
+
+
+@tracing.traced("stage")
+def format_countries():
+    path = os.path.join(DATASET_PATH, CSV_NAMES["Country"])
+    df = read_csv(path)
+
+    df = transform_countries(df)
+
+    write_csv(df, path)
+
+
+@tracing.traced("stage")
+def format_athletes():
+    path = os.path.join(DATASET_PATH, CSV_NAMES["Athlete"])
+    df = read_csv(path)
+
+    df = transform_athletes(df)
+
+    write_csv(df, path)
+
+
+@tracing.traced("stage")
+def format_games():
+    path = os.path.join(DATASET_PATH, CSV_NAMES["Game"])
+    df = read_csv(path)
+
+    df = transform_games(df)
+
+    write_csv(df, path)
+
+
+@tracing.traced("stage")
+def format_results():
+    event_path = os.path.join(DATASET_PATH, CSV_NAMES["Event"])
+    result_path = os.path.join(DATASET_PATH, CSV_NAMES["Result"])
+
+    duplicate_file(event_path, result_path)
+    result_df = read_csv(result_path)
+
+    athlete_path = os.path.join(DATASET_PATH, CSV_NAMES["Athlete"])
+    athlete_df = read_csv(athlete_path)
+
+    result_df = transform_results(result_df, athlete_df["athlete_id"])
+
+    write_csv(result_df, result_path)
+
+
+@tracing.traced("stage")
+def format_sports():
+    path = os.path.join(DATASET_PATH, CSV_NAMES["Event"])
+    df = read_csv(path)
+
+    sports_df, df = transform_sports(df)
+
+    # Save sport mappings to CSV file
+    sports_path = os.path.join(DATASET_PATH, CSV_NAMES["Sport"])
+    write_csv(sports_df, sports_path)
+
+    write_csv(df, path)
+
+
+@tracing.traced("stage")
+def format_events():
+    path = os.path.join(DATASET_PATH, CSV_NAMES["Event"])
+    df = read_csv(path)
+
+    df = transform_events(df)
+
+    write_csv(df, path)
+
+
+# ----------------------------------------
+# ---------- IN-MEMORY PIPELINE ----------
+# ----------------------------------------
+
+
+class SourceReader:
+    """
+    Reads the raw source files of the downloaded dataset on first use, so that each one is read at most once.
+    """
+
+    def __init__(self):
+        self.frames = {}
+
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        if name not in self.frames:
+            self.frames[name] = read_csv(os.path.join(DATASET_PATH, SOURCE_NAMES[name]))
+        return self.frames[name]
+
+
+def format_country_stage(sources, tables: dict) -> pd.DataFrame:
+    return transform_countries(sources["Country"])
+
+
+def format_athlete_stage(sources, tables: dict) -> pd.DataFrame:
+    return transform_athletes(sources["Athlete"])
+
+
+def format_game_stage(sources, tables: dict) -> pd.DataFrame:
+    return transform_games(sources["Game"])
+
+
+def format_result_stage(sources, tables: dict) -> pd.DataFrame:
+    # The raw event results are shared with the sport and event stages
+    return transform_results(sources["Event"].copy(), tables["Athlete"]["athlete_id"])
+
+
+def format_sport_stage(sources, tables: dict) -> pd.DataFrame:
+    sport_df, _ = transform_sports(sources["Event"][["sport"]].copy())
+    return sport_df
+
+
+def format_event_stage(sources, tables: dict) -> pd.DataFrame:
+    sport_df = tables["Sport"]
+    sports_mapping = dict(zip(sport_df["name"], sport_df["sport_id"]))
+
+    # Last stage using the raw event results, so they are modified in place
+    _, event_df = transform_sports(sources["Event"], sports_mapping)
+    return transform_events(event_df)
+
+
+STAGE_FUNCTIONS = {
+    "Country": format_country_stage,
+    "Athlete": format_athlete_stage,
+    "Game": format_game_stage,
+    "Result": format_result_stage,
+    "Sport": format_sport_stage,
+    "Event": format_event_stage,
+}
+
+
+def get_output_names(name: str, output_formats: List[str] = OUTPUT_FORMATS) -> List[str]:
+    file_names = {"csv": CSV_NAMES[name], "parquet": PARQUET_NAMES[name]}
+    return [file_names[output_format] for output_format in output_formats]
+
+
+def get_stage_input_paths(name: str, output_formats: List[str] = OUTPUT_FORMATS) -> List[str]:
+    stage = STAGES[name]
+    file_names = [SOURCE_NAMES[source] for source in stage["sources"]]
+    for table in stage["tables"]:
+        file_names += get_output_names(table, output_formats)
+    return [os.path.join(DATASET_PATH, file_name) for file_name in file_names]
+
+
+def write_tables(tables: dict, output_formats: List[str] = OUTPUT_FORMATS):
+    """
+    Writes the formatted tables to the dataset directory.
+
+    Args:
+    - tables: Formatted DataFrames keyed like `CSV_NAMES`.
+    - output_formats: Any of "csv" and "parquet".
+    """
+
+    if "parquet" in output_formats:
+        schemas = get_parquet_schemas()
+
+    for name, df in tables.items():
+        if "csv" in output_formats:
+            path = os.path.join(DATASET_PATH, CSV_NAMES[name])
+            write_csv(df, path)
+            print(f"Written: {CSV_NAMES[name]} ({len(df)} rows)")
+
+        if "parquet" in output_formats:
+            path = os.path.join(DATASET_PATH, PARQUET_NAMES[name])
+            write_parquet(df, path, schemas[name])
+            print(f"Written: {PARQUET_NAMES[name]} ({len(df)} rows)")
+
+
+def run_stage(
+    name: str,
+    sources: SourceReader,
+    tables: dict,
+    output_formats: List[str] = OUTPUT_FORMATS,
+    use_cache: bool = USE_STAGE_CACHE,
+):
+    """
+    Runs a formatting stage and writes its table, unless its output can be restored from the stage cache.
+
+    Args:
+    - name: Key of the stage in `STAGES`.
+    - sources: Raw source files.
+    - tables: Tables formatted by previous stages, the formatted table is added to it. Tables of stages that
+      ran somewhere else are read from the dataset directory.
+    - output_formats: Any of "csv" and "parquet".
+    - use_cache: Whether to reuse the output of the stage if its inputs did not change.
+    """
+
+    stage = STAGES[name]
+    output_names = get_output_names(name, output_formats)
+
+    with tracing.span(name, "stage") as record:
+        if use_cache:
+            key = stage_cache.get_stage_key(
+                name,
+                stage["version"],
+                get_stage_input_paths(name, output_formats),
+                output_formats,
+            )
+            if stage_cache.restore_stage(name, key, output_names, DATASET_PATH):
+                record["cache"] = "hit"
+                return
+
+        inputs = {
+            table: tables[table] if table in tables else read_table(table)
+            for table in stage["tables"]
+        }
+        tables[name] = STAGE_FUNCTIONS[name](sources, inputs)
+        record["rows_out"] = len(tables[name])
+        write_tables({name: tables[name]}, output_formats)
+
+        if use_cache:
+            stage_cache.store_stage(name, key, output_names, DATASET_PATH)
+
+
+def run_stage_in_worker(name: str, output_formats: List[str], use_cache: bool) -> tuple:
+    # Each worker process reads its own sources and input tables, only the name and the spans of the
+    # stage are sent back
+    run_stage(name, SourceReader(), {}, output_formats, use_cache)
+    return name, tracing.collect_spans()
+
+
+@tracing.traced("pipeline")
+def format_dataset(
+    output_formats: List[str] = OUTPUT_FORMATS, use_cache: bool = USE_STAGE_CACHE
+):
+    """
+    Formats the downloaded dataset in a single pass: every source file is read once, the stages pass
+    DataFrames to each other in memory and every final table is written once.
+
+    With `use_cache`, a stage whose input files and version did not change since it last ran is not run again,
+    its output is copied from the stage cache instead.
+
+    Args:
+    - output_formats: Any of "csv" and "parquet".
+    - use_cache: Whether to reuse the outputs of unchanged stages.
+    """
+
+    sources = SourceReader()
+    tables = {}
+
+    for name in STAGES:
+        run_stage(name, sources, tables, output_formats, use_cache)
+
+    # Delete the raw source files
+    for file_name in SOURCE_NAMES.values():
+        delete_file(os.path.join(DATASET_PATH, file_name))
+
+
+@tracing.traced("pipeline")
+def format_dataset_parallel(
+    output_formats: List[str] = OUTPUT_FORMATS,
+    use_cache: bool = USE_STAGE_CACHE,
+    max_workers: int = MAX_WORKERS,
+):
+    """
+    Formats the downloaded dataset on a process pool. A stage is started as soon as all stages whose tables it
+    reads are done, so independent tables are formatted at the same time. The output is the same as the one
+    of `format_dataset`.
+
+    Args:
+    - output_formats: Any of "csv" and "parquet".
+    - use_cache: Whether to reuse the outputs of unchanged stages.
+    - max_workers: Number of worker processes, one per CPU by default.
+    """
+
+    pending = dict(STAGES)
+    done = set()
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if all(table in done for table in stage["tables"]):
+                    future = executor.submit(
+                        run_stage_in_worker, name, output_formats, use_cache
+                    )
+                    running[future] = name
+                    del pending[name]
+
+            if not running:
+                raise ValueError(f"Stages with unknown dependencies: {list(pending)}")
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                # Raises the exception of a failed stage, the stages already done stay cached
+                name, spans = future.result()
+                tracing.add_spans(spans)
+                done.add(name)
+                del running[future]
+
+    # Delete the raw source files
+    for file_name in SOURCE_NAMES.values():
+        delete_file(os.path.join(DATASET_PATH, file_name))
+
+
+# ----------------------------------------
+# ---------- STREAMING PIPELINE ----------
+# ----------------------------------------
+
+
+def read_source_chunks(name: str, chunk_size: int = CHUNK_SIZE, **kwargs):
+    """
+    Yields a source file in chunks of `chunk_size` rows, each read in a "read" span of the trace.
+    """
+
+    path = os.path.join(DATASET_PATH, SOURCE_NAMES[name])
+    with open(path, "rb") as file:
+        reader = None
+        for index in itertools.count():
+            with tracing.span(SOURCE_NAMES[name], "read", path=path, chunk=index) as record:
+                position = file.tell()
+                if reader is None:
+                    reader = pd.read_csv(file, dtype=SOURCE_DTYPES[name], chunksize=chunk_size, **kwargs)
+                chunk = next(reader, None)
+                # the parser reads ahead in blocks, so this is the part of the file read for the chunk
+                record["bytes_read"] = file.tell() - position
+                record["rows_out"] = 0 if chunk is None else len(chunk)
+            if chunk is None:
+                return
+            yield chunk
+
+
+def stream_table(
+    source_name: str,
+    transform,
+    output_formats: List[str] = OUTPUT_FORMATS,
+    chunk_size: int = CHUNK_SIZE,
+):
+    """
+    Formats a source file whose transform only looks at one row at a time, chunk by chunk.
+    """
+
+    with tracing.span(source_name, "stage") as record:
+        writer = TableWriter(source_name, output_formats)
+        for chunk in read_source_chunks(source_name, chunk_size):
+            writer.write(transform(chunk))
+        writer.close()
+        record["rows_out"] = writer.rows
+
+
+@tracing.traced("stage")
+def stream_event_results(
+    output_formats: List[str] = OUTPUT_FORMATS, chunk_size: int = CHUNK_SIZE
+):
+    """
+    Formats the result, sport and event tables from the raw athlete event results chunk by chunk. A first
+    pass over the key columns finds the duplicate results and events in the fixed memory of
+    `dedup.MEMORY_BUDGET`, the second pass formats the chunks. Sport ids are tracked across chunks.
+    """
+
+    athlete_ids = pd.concat(
+        read_source_chunks("Athlete", chunk_size, usecols=["athlete_id"]),
+        ignore_index=True,
+    )["athlete_id"]
+
+    # The raw names of the columns identifying a result once the others are deleted, of its `RESULT_KEY` and
+    # of the event_id
+    result_columns = ["edition_id", "result_id", "athlete_id", "pos"]
+    result_deduplicator = ResultDeduplicator(result_columns, result_columns[:3])
+    event_deduplicator = dedup.HashDeduplicator(["result_id"])
+    try:
+        for chunk in read_source_chunks("Event", chunk_size, usecols=result_columns):
+            result_deduplicator.add(chunk)
+            event_deduplicator.add(chunk)
+        result_deduplicator.finish()
+        event_deduplicator.finish()
+    finally:
+        # deletes the spilled partitions if the first pass failed
+        result_deduplicator.close()
+        event_deduplicator.close()
+
+    result_writer = TableWriter("Result", output_formats)
+    event_writer = TableWriter("Event", output_formats)
+    sports_mapping = {}
+    sport_df = pd.DataFrame(columns=["sport_id", "name"])
+
+    # `transform_results` only compares the result ids within a chunk, the ids of all chunks are compared here
+    result_id_deduplicator = dedup.HashDeduplicator()
+    try:
+        for chunk in read_source_chunks("Event", chunk_size):
+            result_df = transform_results(
+                chunk.copy(), athlete_ids, deduplicator=result_deduplicator
+            )
+            result_writer.write(result_df)
+            result_id_deduplicator.add(result_df[["result_id"]])
+
+            sport_df, event_df = transform_sports(chunk, sports_mapping)
+            event_writer.write(transform_events(event_df, deduplicator=event_deduplicator))
+        result_id_deduplicator.finish()
+    finally:
+        result_id_deduplicator.close()
+
+    result_writer.close()
+    event_writer.close()
+
+    if result_id_deduplicator.kept_rows < result_id_deduplicator.rows:
+        raise ValueError("Different results were given the same result_id.")
+
+    # The sport table is only complete once every chunk has been seen
+    sport_writer = TableWriter("Sport", output_formats)
+    sport_writer.write(sport_df)
+    sport_writer.close()
+
+
+@tracing.traced("pipeline")
+def stream_dataset(
+    output_formats: List[str] = OUTPUT_FORMATS, chunk_size: int = CHUNK_SIZE
+):
+    """
+    Formats the downloaded dataset chunk by chunk, so the memory used depends on `chunk_size` and not on the
+    size of the source files. The output is the same as the one of `format_dataset`.
+    """
+
+    stream_table("Country", transform_countries, output_formats, chunk_size)
+    stream_table("Athlete", transform_athletes, output_formats, chunk_size)
+    stream_table("Game", transform_games, output_formats, chunk_size)
+    stream_event_results(output_formats, chunk_size)
+
+    # Delete the raw source files
+    for file_name in SOURCE_NAMES.values():
+        delete_file(os.path.join(DATASET_PATH, file_name))
+
+
+def main(
+    mode: str = FORMAT_MODE,
+    output_formats: List[str] = OUTPUT_FORMATS,
+    chunk_size: int = CHUNK_SIZE,
+    use_cache: bool = USE_STAGE_CACHE,
+    max_workers: int = MAX_WORKERS,
+    source_directory: str = SOURCE_DIRECTORY,
+):
+    """
+    Downloads and formats the dataset.
+
+    Args:
+    - mode: "pipeline", "parallel", "staged" or "streaming", see `FORMAT_MODE`.
+    - output_formats: Any of "csv" and "parquet".
+    - chunk_size: Number of rows formatted at once in "streaming" mode.
+    - use_cache: Whether to reuse the outputs of unchanged stages in "pipeline" and "parallel" mode.
+    - max_workers: Number of processes used in "parallel" mode.
+    - source_directory: Folder with the raw source files, copied instead of downloading the dataset.
+    """
+
     delete_directory(DATASET_PATH)
-    download_directory = download_dataset()  # Download dataset
-    move_folder(
-        download_directory, BASE_DIRECTORY, DATASET_FOLDER
-    )  # Move dataset to working directory
+    with tracing.span("dataset", "download", source=source_directory or DATASET_URL):
+        if source_directory is None:
+            download_directory = download_dataset()  # Download dataset
+            move_folder(
+                download_directory, BASE_DIRECTORY, DATASET_FOLDER
+            )  # Move dataset to working directory
+        else:
+            shutil.copytree(source_directory, DATASET_PATH)
 
     # Delete irrelevant files
     for file in IRRELEVANT_FILES:
         file_path = os.path.join(DATASET_PATH, file)
         delete_file(file_path)
 
+    if mode == "pipeline":
+        format_dataset(output_formats, use_cache)
+        return
+
+    if mode == "parallel":
+        format_dataset_parallel(output_formats, use_cache, max_workers)
+        return
+
+    if mode == "streaming":
+        stream_dataset(output_formats, chunk_size)
+        return
+
     # Rename files
     for old_name, new_name in CSV_NAME_MAPPING.items():
         old_path = os.path.join(DATASET_PATH, old_name)
@@ -378,7 +1148,11 @@ def main():
     format_sports()
     format_events()
 
+    if "parquet" in output_formats:
+        write_tables({name: read_table(name) for name in CSV_NAMES}, ["parquet"])
+
 
 if __name__ == "__main__":
 
     main()
+    tracing.write_trace()
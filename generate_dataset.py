@@ -0,0 +1,325 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from format_csv_files import SOURCE_NAMES
+
+# ----------------------------
+# ---------- CONFIG ----------
+# ----------------------------
+
+OUTPUT_DIRECTORY = "./synthetic_dataset"
+
+# Multiple of the size of the Kaggle snapshot, e.g. 1, 10 or 100
+SCALE_FACTOR = 1
+
+SEED = 0
+
+# Rows of the source files at scale factor 1, close to the Kaggle snapshot. Countries and games are not
+# scaled.
+BASE_ROWS = {"Athlete": 155_000, "Event": 7_500, "Result": 317_000}
+SPORTS = 66
+
+# Share of the result rows written twice, and of the result rows referencing an athlete that does not exist
+DUPLICATE_SHARE = 0.01
+INVALID_ATHLETE_SHARE = 0.005
+
+# Rows generated and written at once, so that memory does not grow with the scale factor
+CHUNK_ROWS = 500_000
+
+# Raw values as they appear in the Kaggle files, with their share of the rows
+RAW_WEIGHTS = {"": 0.55, "72": 0.2, "60-65": 0.05, "ca 80": 0.03, "101, 99": 0.02, "55.5": 0.15}
+RAW_POSITIONS = {
+    "1": 0.05,
+    "2": 0.05,
+    "3": 0.05,
+    "4": 0.05,
+    "5": 0.05,
+    "=5": 0.02,
+    "6": 0.05,
+    "DNS": 0.03,
+    "DNF": 0.05,
+    "AC": 0.35,
+    "DQ": 0.01,
+    "": 0.24,
+}
+BIRTH_DATE_FORMATS = {"%d %B %Y": 0.85, "%Y": 0.05, "c. %Y": 0.03, "": 0.07}
+EVENT_SUFFIXES = {", Men": 0.55, ", Women": 0.35, ", Boys": 0.02, ", Mixed": 0.08}
+
+COUNTRIES = [
+    ("USA", "United States"),
+    ("GER", "Germany"),
+    ("FRA", "France"),
+    ("GBR", "Great Britain"),
+    ("ITA", "Italy"),
+    ("JPN", "Japan"),
+    ("CHN", "People's Republic of China"),
+    ("AUS", "Australia"),
+    ("CAN", "Canada"),
+    ("SWE", "Sweden"),
+    ("NOR", "Norway"),
+    ("BRA", "Brazil"),
+    ("KEN", "Kenya"),
+    ("RUS", "Russian Federation"),
+    ("ROC", "Russian Olympic Committee"),
+    # second row of the same key, dropped by the formatting
+    ("ROC", "ROC"),
+    # athletes of the International Federation are counted for Italy by the formatting
+    ("IFR", "International Federation"),
+]
+
+# Games that were planned but not held
+CANCELLED_YEARS = [1916, 1940, 1944]
+
+# Athletes are born in the order of their ids over these years, a result goes to an athlete of about this
+# age (mean and standard deviation in years) at the year of the game
+BIRTH_YEARS = (1860, 2006)
+AGE_AT_GAMES = (25, 5)
+
+MEDALS = {"1": "Gold", "2": "Silver", "3": "Bronze"}
+
+# Columns of Olympic_Athlete_Event_Results.csv, result_id is the id of the event
+RESULT_COLUMNS = [
+    "edition",
+    "edition_id",
+    "country_noc",
+    "sport",
+    "event",
+    "result_id",
+    "athlete",
+    "athlete_id",
+    "pos",
+    "medal",
+    "isTeamSport",
+]
+
+# ---------------------------
+# ---------- UTILS ----------
+# ---------------------------
+
+
+def choose(rng: np.random.Generator, values: dict, size: int) -> np.ndarray:
+    """
+    Draws `size` values of `values` with the share of every value as its probability.
+    """
+
+    weights = np.array(list(values.values()))
+    return rng.choice(np.array(list(values), dtype=object), size, p=weights / weights.sum())
+
+
+def get_chunk_rng(seed: int, name: str, chunk: int) -> np.random.Generator:
+    # every chunk has its own generator, the files only depend on the seed and `CHUNK_ROWS`
+    return np.random.default_rng([seed, sum(map(ord, name)), chunk])
+
+
+def get_chunks(rows: int):
+    for chunk, start in enumerate(range(0, rows, CHUNK_ROWS)):
+        yield chunk, start, min(start + CHUNK_ROWS, rows)
+
+
+def get_games() -> pd.DataFrame:
+    """
+    Returns every edition of the games in the raw format of Olympics_Games.csv, dates are day-first without
+    the year and partly missing or a dash.
+    """
+
+    editions = [(year, "Summer") for year in range(1896, 2024, 4)]
+    editions += [(year, "Winter") for year in [*range(1924, 1993, 4), *range(1994, 2023, 4)]]
+    editions.sort()
+
+    rng = np.random.default_rng(0)
+    games = []
+    for game_id, (year, season) in enumerate(editions, start=1):
+        month = "July" if season == "Summer" else "February"
+        start_day = int(rng.integers(1, 15))
+        start_date, end_date = f" {start_day} {month}", f"{start_day + 14} {month}"
+        if year < 1912:
+            # the early games lasted for months and have no dates in the source
+            start_date, end_date = str(rng.choice(["", "—"])), ""
+        country_id = COUNTRIES[game_id % 12][0]
+        games.append(
+            {
+                "edition": f"{year} {season} Olympics",
+                "edition_id": game_id,
+                "edition_url": f"/editions/{game_id}",
+                "year": year,
+                "city": f"City {game_id}",
+                "country_flag_url": f"/flags/{country_id}.png",
+                "country_noc": country_id,
+                "start_date": start_date,
+                "end_date": end_date,
+                "competition_date": f"{start_date} – {end_date}",
+                "isHeld": "Not held due to war" if year in CANCELLED_YEARS else "",
+            }
+        )
+    return pd.DataFrame(games)
+
+
+def get_events(rng: np.random.Generator, events: int, games: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the game, year, sport, name and team flag of every event.
+    """
+
+    held_games = games[games["isHeld"] == ""]
+    game_rows = rng.integers(0, len(held_games), events)
+    sport_ids = rng.integers(1, SPORTS + 1, events)
+    return pd.DataFrame(
+        {
+            "edition": held_games["edition"].to_numpy()[game_rows],
+            "edition_id": held_games["edition_id"].to_numpy()[game_rows],
+            # only used to pick the athletes, not written
+            "year": held_games["year"].to_numpy()[game_rows],
+            "sport": [f"Sport {sport_id}" for sport_id in sport_ids],
+            "event": [
+                f"Event {event_id}{suffix}"
+                for event_id, suffix in zip(range(1, events + 1), choose(rng, EVENT_SUFFIXES, events))
+            ],
+            "result_id": np.arange(1, events + 1),
+            "isTeamSport": rng.random(events) < 0.2,
+        }
+    )
+
+
+# --------------------------------
+# ---------- GENERATORS ----------
+# --------------------------------
+
+
+def write_chunk(df: pd.DataFrame, path: str, chunk: int):
+    df.to_csv(path, mode="w" if chunk == 0 else "a", header=chunk == 0, index=False)
+
+
+def generate_countries(output_directory: str):
+    df = pd.DataFrame(COUNTRIES, columns=["noc", "country"])
+    df.to_csv(os.path.join(output_directory, SOURCE_NAMES["Country"]), index=False)
+
+
+def generate_games(output_directory: str) -> pd.DataFrame:
+    df = get_games()
+    df.to_csv(os.path.join(output_directory, SOURCE_NAMES["Game"]), index=False)
+    return df
+
+
+def generate_athletes(output_directory: str, athletes: int, seed: int):
+    path = os.path.join(output_directory, SOURCE_NAMES["Athlete"])
+    nocs = np.array(list(dict(COUNTRIES)), dtype=object)
+
+    for chunk, start, end in get_chunks(athletes):
+        rng = get_chunk_rng(seed, "Athlete", chunk)
+        rows = end - start
+        ids = np.arange(start + 1, end + 1)
+
+        first_year, last_year = BIRTH_YEARS
+        days = (ids - 1) / athletes * (last_year - first_year) * 365.25 + rng.normal(0, 365, rows)
+        birth_dates = pd.Timestamp(first_year, 1, 1) + pd.to_timedelta(days.round(), unit="D")
+        birth_formats = choose(rng, BIRTH_DATE_FORMATS, rows)
+        born = np.full(rows, "", dtype=object)
+        for date_format in BIRTH_DATE_FORMATS:
+            if date_format:
+                is_format = birth_formats == date_format
+                born[is_format] = birth_dates[is_format].strftime(date_format)
+
+        heights = np.round(rng.normal(176, 10, rows))
+        heights[rng.random(rows) < 0.3] = np.nan
+
+        write_chunk(
+            pd.DataFrame(
+                {
+                    "athlete_id": ids,
+                    "name": [f"Athlete {athlete_id}" for athlete_id in ids],
+                    "sex": np.where(rng.random(rows) < 0.7, "Male", "Female"),
+                    "born": born,
+                    "height": heights,
+                    "weight": choose(rng, RAW_WEIGHTS, rows),
+                    "country": "",
+                    "country_noc": rng.choice(nocs, rows),
+                    "description": np.where(rng.random(rows) < 0.1, "Competed in several events.", ""),
+                    "special_notes": "",
+                }
+            ),
+            path,
+            chunk,
+        )
+
+
+def generate_results(
+    output_directory: str, results: int, athletes: int, events: pd.DataFrame, seed: int
+) -> int:
+    path = os.path.join(output_directory, SOURCE_NAMES["Event"])
+    written = 0
+
+    for chunk, start, end in get_chunks(results):
+        rng = get_chunk_rng(seed, "Result", chunk)
+        rows = end - start
+
+        df = events.iloc[rng.integers(0, len(events), rows)].reset_index(drop=True)
+        first_year, last_year = BIRTH_YEARS
+        birth_years = df["year"].to_numpy() - rng.normal(*AGE_AT_GAMES, rows)
+        athlete_ids = (birth_years - first_year) / (last_year - first_year) * athletes
+        athlete_ids = np.clip(athlete_ids.round().astype("int64"), 1, athletes)
+        invalid = rng.random(rows) < INVALID_ATHLETE_SHARE
+        athlete_ids[invalid] = athletes + rng.integers(1, 1000, invalid.sum())
+        positions = choose(rng, RAW_POSITIONS, rows)
+
+        df.insert(2, "country_noc", "USA")
+        df.insert(5, "athlete", [f"Athlete {athlete_id}" for athlete_id in athlete_ids])
+        df.insert(6, "athlete_id", athlete_ids)
+        df.insert(7, "pos", positions)
+        df.insert(8, "medal", pd.Series(positions).map(MEDALS).fillna(""))
+        df = df[RESULT_COLUMNS]
+
+        # the same result listed twice, right after itself like in the source
+        duplicates = df[rng.random(rows) < DUPLICATE_SHARE]
+        df = pd.concat([df, duplicates]).sort_index(kind="stable")
+
+        write_chunk(df, path, chunk)
+        written += len(df)
+    return written
+
+
+def generate_dataset(
+    output_directory: str = OUTPUT_DIRECTORY, scale_factor: float = SCALE_FACTOR, seed: int = SEED
+) -> dict:
+    """
+    Writes raw source files shaped like the Kaggle dataset (Olympic_Athlete_Bio.csv, Olympics_Country.csv,
+    Olympics_Games.csv and Olympic_Athlete_Event_Results.csv) with `scale_factor` times as many athletes,
+    events and results, so that the formatting, the load and the analyses can be run and benchmarked
+    without network access and beyond the size of the snapshot. The values are as messy as the originals:
+    free-text weights, day-first dates, duplicate result rows and results of athletes that do not exist.
+    The same seed always writes the same files. Returns the number of rows of every file.
+
+    Args:
+    - output_directory: Folder the source files are written to, the `DATASET_PATH` after a download.
+    - scale_factor: Multiple of the size of the Kaggle snapshot.
+    - seed: Seed of the random values.
+    """
+
+    start = time.perf_counter()
+    os.makedirs(output_directory, exist_ok=True)
+
+    athletes = max(int(BASE_ROWS["Athlete"] * scale_factor), 1)
+    events = max(int(BASE_ROWS["Event"] * scale_factor), 1)
+    results = max(int(BASE_ROWS["Result"] * scale_factor), 1)
+
+    generate_countries(output_directory)
+    games = generate_games(output_directory)
+    generate_athletes(output_directory, athletes, seed)
+    event_df = get_events(np.random.default_rng([seed, events]), events, games)
+    result_rows = generate_results(output_directory, results, athletes, event_df, seed)
+
+    rows = {"Country": len(COUNTRIES), "Game": len(games), "Athlete": athletes, "Event": result_rows}
+    print(
+        f"Generated scale factor {scale_factor} in '{output_directory}' in "
+        f"{time.perf_counter() - start:.2f}s ({athletes} athletes, {events} events, {result_rows} results)"
+    )
+    return rows
+
+
+def main(output_directory: str = OUTPUT_DIRECTORY, scale_factor: float = SCALE_FACTOR, seed: int = SEED):
+    generate_dataset(output_directory, scale_factor, seed)
+
+
+if __name__ == "__main__":
+
+    main()
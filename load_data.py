@@ -0,0 +1,605 @@
+import io
+import os
+import time
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2 import sql
+from typing import List
+
+import tracing
+from database import DBConfig, connect_to_db
+from format_csv_files import CSV_NAMES, DATASET_PATH
+
+# ----------------------------
+# ---------- CONFIG ----------
+# ----------------------------
+
+SCHEMA_PATH = "./create_tables.sql"
+VIEWS_PATH = "./create_views.sql"
+
+# Updates filling the derived columns of the tables (game season and start date, age at game of every result),
+# run after every load before the views are refreshed
+DERIVED_COLUMNS_PATH = "./derive_columns.sql"
+
+# Materialized views of `VIEWS_PATH`, refreshed after every load
+MATERIALIZED_VIEWS = ["country_medals", "game_participation", "age_sample"]
+
+# Database table and columns of every table in `CSV_NAMES`
+TABLES = {
+    "Country": ("country", ["country_id", "name"]),
+    "Sport": ("sport", ["sport_id", "name"]),
+    "Athlete": (
+        "athlete",
+        ["athlete_id", "name", "gender", "date_of_birth", "height", "weight", "country_id"],
+    ),
+    "Game": (
+        "game",
+        ["game_id", "title", "year", "city", "start_date", "end_date", "was_held", "country_id"],
+    ),
+    "Event": ("event", ["event_id", "name", "gender", "is_team_event", "sport_id"]),
+    "Result": ("result", ["result_id", "position", "game_id", "event_id", "athlete_id"]),
+}
+
+# Tables are loaded after every table they reference with a foreign key
+LOAD_ORDER = ["Country", "Sport", "Athlete", "Game", "Event", "Result"]
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# "copy" replaces all rows with a single COPY per table, "fast" does the same with `fast_load_dataset`,
+# "sync" only applies the rows that changed since the last load with `sync_dataset` and "refresh" only
+# refreshes the materialized views
+LOAD_MODE = "copy"
+
+# Fast load: the result table is split into this many key ranges, each copied over its own connection
+LOAD_WORKERS = 4
+PARTITIONED_TABLE = "Result"
+
+# Memory for building the indexes and validating the foreign keys after a fast load
+MAINTENANCE_WORK_MEM = "512MB"
+
+# ---------------------------
+# ---------- UTILS ----------
+# ---------------------------
+
+
+def run_sql_file(conn, path: str):
+    with open(path) as file:
+        statements = file.read()
+
+    cur = conn.cursor()
+    cur.execute(statements)
+    cur.close()
+
+
+def widen_result_ids(conn):
+    """
+    Changes the result ids of a database created before the stable row ids of format_csv_files.py to BIGINT,
+    as CREATE TABLE IF NOT EXISTS keeps their INT column. The materialized views reading the column block the
+    change, so they are dropped first and created again from `VIEWS_PATH` by `create_tables`.
+    """
+
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = 'result' AND column_name = 'result_id'"
+    )
+    if cur.fetchone()[0] != "bigint":
+        cur.execute(
+            sql.SQL("DROP MATERIALIZED VIEW IF EXISTS {}").format(
+                sql.SQL(", ").join(sql.Identifier(view) for view in MATERIALIZED_VIEWS)
+            )
+        )
+        cur.execute('ALTER TABLE "result" ALTER COLUMN result_id TYPE BIGINT')
+        print("Result ids have been changed to BIGINT.")
+    cur.close()
+
+
+def create_tables(conn):
+    run_sql_file(conn, SCHEMA_PATH)
+    widen_result_ids(conn)
+    run_sql_file(conn, VIEWS_PATH)
+    print(f"Tables have been created from '{SCHEMA_PATH}' and '{VIEWS_PATH}'.")
+
+
+def derive_columns(conn):
+    """
+    Fills the derived columns of `DERIVED_COLUMNS_PATH` from the loaded rows, in the transaction of the load.
+    Only rows whose derived value changed are written, so a sync only rewrites the rows it touched.
+    """
+
+    start = time.perf_counter()
+    with tracing.span("derive_columns", "load"):
+        run_sql_file(conn, DERIVED_COLUMNS_PATH)
+    print(f"Derived columns from '{DERIVED_COLUMNS_PATH}' in {time.perf_counter() - start:.2f}s")
+
+
+def refresh_views(conn, concurrently: bool = False):
+    """
+    Recomputes the materialized views from the current content of the tables, to be run after every load.
+
+    Args:
+    - conn: Database connection object.
+    - concurrently: Whether to keep the views readable during the refresh, which takes longer.
+    """
+
+    start = time.perf_counter()
+    cur = conn.cursor()
+    for view in MATERIALIZED_VIEWS:
+        cur.execute(
+            sql.SQL("REFRESH MATERIALIZED VIEW {}{}").format(
+                sql.SQL("CONCURRENTLY " if concurrently else ""), sql.Identifier(view)
+            )
+        )
+    cur.close()
+    conn.commit()
+    print(f"Refreshed {MATERIALIZED_VIEWS} in {time.perf_counter() - start:.2f}s")
+
+
+def truncate_tables(conn, names: List[str] = LOAD_ORDER):
+    cur = conn.cursor()
+    cur.execute(
+        sql.SQL("TRUNCATE {}").format(
+            sql.SQL(", ").join(sql.Identifier(TABLES[name][0]) for name in names)
+        )
+    )
+    cur.close()
+    print(f"Tables have been truncated: {[TABLES[name][0] for name in names]}")
+
+
+def get_copy_statement(name: str, table: str = None) -> sql.Composed:
+    """
+    Returns the COPY FROM STDIN statement of a table.
+
+    Args:
+    - name: Key of the table in `CSV_NAMES`.
+    - table: Database table to copy into, the table of `name` by default.
+    """
+
+    columns = TABLES[name][1]
+    if table is None:
+        table = TABLES[name][0]
+
+    return sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, HEADER true)").format(
+        sql.Identifier(table),
+        sql.SQL(", ").join(sql.Identifier(column) for column in columns),
+    )
+
+
+# ----------------------------------
+# ---------- BULK LOADING ----------
+# ----------------------------------
+
+
+def load_table(conn, name: str, source, table: str = None) -> int:
+    """
+    Streams a formatted table into its database table with COPY FROM STDIN, so the file does not have to be on
+    the database host. Returns the number of loaded rows.
+
+    Args:
+    - conn: Database connection object.
+    - name: Key of the table in `CSV_NAMES`.
+    - source: Path of a CSV file, a file-like object with CSV data or a formatted DataFrame.
+    - table: Database table to copy into, the table of `name` by default.
+    """
+
+    if table is None:
+        table = TABLES[name][0]
+
+    if isinstance(source, pd.DataFrame):
+        source = io.StringIO(source.to_csv(index=False))
+
+    start = time.perf_counter()
+    cur = conn.cursor()
+
+    with tracing.span(table, "load") as record:
+        if isinstance(source, str):
+            with open(source) as file:
+                cur.copy_expert(get_copy_statement(name, table), file, size=COPY_BUFFER_SIZE)
+            record["bytes_read"] = tracing.get_file_size(source)
+        else:
+            cur.copy_expert(get_copy_statement(name, table), source, size=COPY_BUFFER_SIZE)
+
+        rows = cur.rowcount
+        record["rows_out"] = rows
+    cur.close()
+
+    seconds = time.perf_counter() - start
+    print(
+        f"Loaded {rows} rows into '{table}' in {seconds:.2f}s "
+        f"({rows / max(seconds, 1e-9):,.0f} rows/s)"
+    )
+    return rows
+
+
+def load_dataset(conn, tables: dict = None):
+    """
+    Loads every formatted table in foreign key order and fills the derived columns in a single transaction.
+
+    Args:
+    - conn: Database connection object.
+    - tables: Sources of the tables keyed like `CSV_NAMES`, see `load_table`. The CSV files of the dataset
+      directory are loaded by default.
+    """
+
+    if tables is None:
+        tables = {
+            name: os.path.join(DATASET_PATH, CSV_NAMES[name]) for name in LOAD_ORDER
+        }
+
+    start = time.perf_counter()
+    rows = 0
+
+    try:
+        for name in LOAD_ORDER:
+            rows += load_table(conn, name, tables[name])
+        derive_columns(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    seconds = time.perf_counter() - start
+    print(f"Loaded {rows} rows in {seconds:.2f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
+
+
+# -------------------------------
+# ---------- FAST LOAD ----------
+# -------------------------------
+
+
+def get_table_definitions(conn, names: List[str] = LOAD_ORDER):
+    """
+    Returns the constraints and the other indexes of the tables, as (table, name, definition) tuples.
+    Constraints are sorted so that primary and unique keys come before the foreign keys referencing them.
+    """
+
+    table_names = [TABLES[name][0] for name in names]
+    cur = conn.cursor()
+
+    cur.execute(
+        """
+        SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = ANY(%s::regclass[]) AND contype IN ('p', 'u', 'f')
+        ORDER BY contype = 'f', conrelid, conname
+        """,
+        (table_names,),
+    )
+    constraints = cur.fetchall()
+
+    cur.execute(
+        """
+        SELECT indrelid::regclass::text, indexrelid::regclass::text, pg_get_indexdef(indexrelid)
+        FROM pg_index
+        WHERE indrelid = ANY(%s::regclass[])
+        AND indexrelid NOT IN (SELECT conindid FROM pg_constraint)
+        ORDER BY indrelid, indexrelid
+        """,
+        (table_names,),
+    )
+    indexes = cur.fetchall()
+
+    cur.close()
+    return constraints, indexes
+
+
+def drop_table_definitions(conn, constraints: list, indexes: list):
+    cur = conn.cursor()
+
+    # Foreign keys first, they depend on the primary keys
+    for table, name, _ in reversed(constraints):
+        cur.execute(
+            sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(
+                sql.SQL(table), sql.Identifier(name)
+            )
+        )
+    for _, name, _ in indexes:
+        cur.execute(sql.SQL("DROP INDEX {}").format(sql.SQL(name)))
+
+    cur.close()
+    print(f"Dropped {len(constraints)} constraints and {len(indexes)} indexes.")
+
+
+def restore_table_definitions(conn, constraints: list, indexes: list):
+    cur = conn.cursor()
+    cur.execute(sql.SQL("SET maintenance_work_mem = {}").format(sql.Literal(MAINTENANCE_WORK_MEM)))
+
+    start = time.perf_counter()
+
+    # Primary keys, then the other indexes and finally the foreign keys, each checked in a single pass
+    primary_keys = [c for c in constraints if not c[2].startswith("FOREIGN KEY")]
+    foreign_keys = [c for c in constraints if c[2].startswith("FOREIGN KEY")]
+
+    for table, name, definition in primary_keys:
+        cur.execute(
+            sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} {}").format(
+                sql.SQL(table), sql.Identifier(name), sql.SQL(definition)
+            )
+        )
+    for _, _, definition in indexes:
+        cur.execute(definition)
+    for table, name, definition in foreign_keys:
+        cur.execute(
+            sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} {}").format(
+                sql.SQL(table), sql.Identifier(name), sql.SQL(definition)
+            )
+        )
+
+    cur.close()
+    print(
+        f"Restored {len(constraints)} constraints and {len(indexes)} indexes "
+        f"in {time.perf_counter() - start:.2f}s."
+    )
+
+
+def split_key_ranges(df: pd.DataFrame, key: str, parts: int) -> List[pd.DataFrame]:
+    """
+    Splits a table into `parts` tables of about the same size, each covering a contiguous range of `key`.
+    """
+
+    df = df.sort_values(key, key=pd.to_numeric, kind="stable")
+    bounds = [len(df) * part // parts for part in range(parts + 1)]
+    return [df.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def load_partition(config_params, name: str, df: pd.DataFrame) -> int:
+    conn = connect_to_db(config_params)
+    try:
+        rows = load_table(conn, name, df)
+        conn.commit()
+    finally:
+        conn.close()
+    return rows
+
+
+def fast_load_dataset(
+    conn, config_params=None, tables: dict = None, workers: int = LOAD_WORKERS
+):
+    """
+    Reloads the whole dataset as fast as possible. The constraints and indexes are dropped, the tables are
+    copied while empty of any index, with the result table split into key ranges copied in parallel, the
+    derived columns are filled and then the constraints and indexes are added back in one pass per table and
+    the tables are analyzed.
+
+    If anything fails, the tables are emptied and their constraints and indexes are restored.
+
+    Args:
+    - conn: Database connection object.
+    - config_params: Database config used to open the connections of the parallel workers.
+    - tables: Paths or DataFrames of the tables keyed like `CSV_NAMES`, see `load_dataset`.
+    - workers: Number of connections copying the result table at the same time.
+    """
+
+    if config_params is None:
+        config_params = DBConfig()
+    if tables is None:
+        tables = {
+            name: os.path.join(DATASET_PATH, CSV_NAMES[name]) for name in LOAD_ORDER
+        }
+
+    start = time.perf_counter()
+
+    constraints, indexes = get_table_definitions(conn)
+    drop_table_definitions(conn, constraints, indexes)
+    truncate_tables(conn)
+    conn.commit()
+
+    try:
+        rows = 0
+        for name in LOAD_ORDER:
+            if name != PARTITIONED_TABLE:
+                rows += load_table(conn, name, tables[name])
+        conn.commit()
+
+        # Keep the text of the CSV file as it is, the database parses it
+        df = tables[PARTITIONED_TABLE]
+        if not isinstance(df, pd.DataFrame):
+            df = pd.read_csv(df, dtype=str, keep_default_na=False)
+
+        key = TABLES[PARTITIONED_TABLE][1][0]
+        partitions = split_key_ranges(df, key, workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rows += sum(
+                executor.map(
+                    lambda partition: load_partition(
+                        config_params, PARTITIONED_TABLE, partition
+                    ),
+                    partitions,
+                )
+            )
+
+        # before the indexes are back, so that the updated rows need no index entries
+        derive_columns(conn)
+        restore_table_definitions(conn, constraints, indexes)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        truncate_tables(conn)
+        restore_table_definitions(conn, constraints, indexes)
+        conn.commit()
+        raise
+
+    cur = conn.cursor()
+    cur.execute(
+        sql.SQL("ANALYZE {}").format(
+            sql.SQL(", ").join(sql.Identifier(TABLES[name][0]) for name in LOAD_ORDER)
+        )
+    )
+    cur.close()
+    conn.commit()
+
+    seconds = time.perf_counter() - start
+    print(f"Fast loaded {rows} rows in {seconds:.2f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
+
+
+# ------------------------------------
+# ---------- INCREMENTAL SYNC ----------
+# ------------------------------------
+
+
+def get_staging_table(name: str) -> str:
+    return f"sync_{TABLES[name][0]}"
+
+
+def stage_table(conn, name: str, source) -> int:
+    """
+    Copies the new version of a table into a temporary table without any constraint, dropped on commit.
+    """
+
+    cur = conn.cursor()
+    cur.execute(
+        sql.SQL("CREATE TEMP TABLE {} (LIKE {}) ON COMMIT DROP").format(
+            sql.Identifier(get_staging_table(name)), sql.Identifier(TABLES[name][0])
+        )
+    )
+    cur.close()
+
+    return load_table(conn, name, source, get_staging_table(name))
+
+
+def upsert_table(conn, name: str):
+    """
+    Inserts the staged rows that are new and updates the ones that changed, rows that did not change are not
+    written at all. Returns the number of inserted and updated rows.
+    """
+
+    table, columns = TABLES[name]
+    key, values = columns[0], columns[1:]
+
+    cur = conn.cursor()
+    cur.execute(
+        sql.SQL(
+            """
+            WITH changed AS (
+                INSERT INTO {table} AS t ({columns})
+                SELECT {columns} FROM {staging_table}
+                ON CONFLICT ({key}) DO UPDATE SET ({values}) = ROW({excluded_values})
+                WHERE ({table_values}) IS DISTINCT FROM ({excluded_values})
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted)
+            FROM changed
+            """
+        ).format(
+            table=sql.Identifier(table),
+            staging_table=sql.Identifier(get_staging_table(name)),
+            key=sql.Identifier(key),
+            columns=sql.SQL(", ").join(sql.Identifier(column) for column in columns),
+            values=sql.SQL(", ").join(sql.Identifier(column) for column in values),
+            table_values=sql.SQL(", ").join(
+                sql.Identifier("t", column) for column in values
+            ),
+            excluded_values=sql.SQL(", ").join(
+                sql.Identifier("excluded", column) for column in values
+            ),
+        )
+    )
+    inserted, updated = cur.fetchone()
+    cur.close()
+    return inserted, updated
+
+
+def delete_missing_rows(conn, name: str) -> int:
+    """
+    Deletes the rows whose primary key is not part of the staged table anymore.
+    """
+
+    table, columns = TABLES[name]
+
+    cur = conn.cursor()
+    cur.execute(
+        sql.SQL(
+            """
+            DELETE FROM {table} AS t
+            WHERE NOT EXISTS (SELECT 1 FROM {staging_table} AS s WHERE s.{key} = t.{key})
+            """
+        ).format(
+            table=sql.Identifier(table),
+            staging_table=sql.Identifier(get_staging_table(name)),
+            key=sql.Identifier(columns[0]),
+        )
+    )
+    deleted = cur.rowcount
+    cur.close()
+    return deleted
+
+
+def sync_dataset(conn, tables: dict = None):
+    """
+    Brings the database up to date with the formatted dataset by applying only the differences: rows are
+    compared by primary key, new rows are inserted, changed rows are updated and rows missing from the dataset
+    are deleted. Everything runs in a single transaction, so readers see either the old or the new dataset.
+
+    Args:
+    - conn: Database connection object.
+    - tables: Sources of the tables keyed like `CSV_NAMES`, see `load_table`. The CSV files of the dataset
+      directory are used by default.
+    """
+
+    if tables is None:
+        tables = {
+            name: os.path.join(DATASET_PATH, CSV_NAMES[name]) for name in LOAD_ORDER
+        }
+
+    start = time.perf_counter()
+    changes = {}
+
+    try:
+        # Parents first for the inserts and updates, children first for the deletes
+        for name in LOAD_ORDER:
+            stage_table(conn, name, tables[name])
+            changes[name] = upsert_table(conn, name)
+        for name in reversed(LOAD_ORDER):
+            changes[name] += (delete_missing_rows(conn, name),)
+        derive_columns(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    for name in LOAD_ORDER:
+        inserted, updated, deleted = changes[name]
+        print(
+            f"Synced '{TABLES[name][0]}': {inserted} inserted, {updated} updated, {deleted} deleted"
+        )
+    print(f"Synced the dataset in {time.perf_counter() - start:.2f}s")
+
+
+def main(mode: str = LOAD_MODE):
+    """
+    Creates the tables and loads the formatted dataset.
+
+    Args:
+    - mode: "copy", "fast", "sync" or "refresh", see `LOAD_MODE`.
+    """
+
+    db_config_params = DBConfig()
+    conn = connect_to_db(db_config_params)
+
+    create_tables(conn)
+
+    if mode == "fast":
+        fast_load_dataset(conn, db_config_params)
+    elif mode == "sync":
+        sync_dataset(conn)
+    elif mode == "copy":
+        truncate_tables(conn)
+        load_dataset(conn)
+
+    # Keep the views readable while only a few rows changed
+    refresh_views(conn, concurrently=mode == "sync")
+    conn.close()
+
+    # Rows updated in place keep the version stamps of the query and output caches, imported here as the query
+    # cache reads `TABLES`
+    import output_cache
+    import query_cache
+
+    query_cache.clear_cache()
+    output_cache.clear_cache()
+
+
+if __name__ == "__main__":
+
+    main()
+    tracing.write_trace()
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import Callable, Optional
+
+# Only the standard library is imported here: the output of a command is looked up before the CLI imports
+# pandas, the database drivers or builds a DuckDB database, see cli.py.
+
+# ----------------------------
+# ---------- CONFIG ----------
+# ----------------------------
+
+CACHE_DIRECTORY = "./.output_cache"
+
+USE_OUTPUT_CACHE = True
+
+# ---------------------------
+# ---------- UTILS ----------
+# ---------------------------
+
+
+def get_file_state(path: str) -> list:
+    """
+    Returns the path, size and modification time of a file, None for both if it does not exist.
+    """
+
+    if not os.path.exists(path):
+        return [path, None, None]
+    stat = os.stat(path)
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+
+def get_output_key(command: list, database: list) -> str:
+    """
+    Returns the cache key of the output of a command: its arguments and the database it reads.
+    """
+
+    key = {"command": command, "database": database}
+    return hashlib.sha256(json.dumps(key, default=str).encode()).hexdigest()
+
+
+def get_entry_path(key: str) -> str:
+    return os.path.join(CACHE_DIRECTORY, f"{key}.json")
+
+
+def is_current(entry: dict, connect: Callable) -> bool:
+    """
+    Returns whether none of the files and tables an output was made from changed since. The tables are only
+    queried, on a new connection of `connect`, if none of the files changed.
+    """
+
+    if any(get_file_state(path) != [path, size, mtime] for path, size, mtime in entry["files"]):
+        return False
+    if not entry["stamps"]:
+        return True
+
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        for query, stamp in entry["stamps"]:
+            cur.execute(query)
+            if json.dumps(cur.fetchone(), default=str) != stamp:
+                return False
+        return True
+    finally:
+        conn.close()
+
+
+def clear_cache():
+    shutil.rmtree(CACHE_DIRECTORY, ignore_errors=True)
+
+
+# ----------------------------------
+# ---------- OUTPUT CACHE ----------
+# ----------------------------------
+
+
+def read_output(key: str, connect: Callable) -> Optional[str]:
+    """
+    Returns the cached output of a command, or None if it has to be run because it was never stored or one
+    of its files or tables changed.
+
+    Args:
+    - key: Cache key of the command, see `get_output_key`.
+    - connect: Returns a new connection to the database, to compare the version stamps of its tables.
+    """
+
+    if not USE_OUTPUT_CACHE:
+        return None
+    try:
+        with open(get_entry_path(key)) as file:
+            entry = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return entry["output"] if is_current(entry, connect) else None
+
+
+def store_output(key: str, output: str, dependencies: dict):
+    """
+    Caches the output of a command, replacing its previous entry, so there is one entry per command.
+
+    Args:
+    - key: Cache key of the command, see `get_output_key`.
+    - output: Text printed by the command.
+    - dependencies: State of the files and tables the output was made from, taken before the command ran,
+      see `query_cache.get_dependencies`.
+    """
+
+    if not USE_OUTPUT_CACHE:
+        return
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    path = get_entry_path(key)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump({"output": output, **dependencies}, file)
+    os.replace(temporary_path, path)
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from typing import Callable
+
+import pandas as pd
+
+import tracing
+from embedded_database import DuckDBConfig
+from format_csv_files import CSV_NAMES, PARQUET_NAMES
+from load_data import DERIVED_COLUMNS_PATH, MATERIALIZED_VIEWS, SCHEMA_PATH, TABLES, VIEWS_PATH
+from output_cache import get_file_state
+
+# ----------------------------
+# ---------- CONFIG ----------
+# ----------------------------
+
+CACHE_DIRECTORY = "./.query_cache"
+
+USE_QUERY_CACHE = True
+
+# The least recently used entries are dropped once all entries together are bigger than this
+MAX_CACHE_SIZE = 512 * 1024 * 1024
+
+# Column compared by the version stamp of every table, besides its row count
+TABLE_KEYS = {table: columns[0] for table, columns in TABLES.values()}
+
+# ---------------------------
+# ---------- UTILS ----------
+# ---------------------------
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Removes comments, repeated whitespace and the final semicolon, so that the same query written with
+    different indentation gets the same cache key.
+    """
+
+    query = re.sub(r"--[^\n]*", "", query)
+    return re.sub(r"\s+", " ", query).strip().rstrip(";").strip()
+
+
+def get_touched_tables(query: str):
+    """
+    Returns the tables and materialized views a query reads, or None if it reads anything else (a function,
+    a system catalog, ...) that has no version stamp. Names defined by a WITH clause are left out.
+    """
+
+    # the FROM of EXTRACT(YEAR FROM age) does not read a table
+    query = re.sub(r"\bEXTRACT\s*\(\s*\w+\s+FROM\b", "EXTRACT(", query, flags=re.IGNORECASE)
+    names = re.findall(r'\b(?:FROM|JOIN)\s+"?([A-Za-z_]\w*)"?', query, re.IGNORECASE)
+    common_table_expressions = re.findall(r"\b(\w+)\s+AS\s*\(", query, re.IGNORECASE)
+    names = {name.lower() for name in names} - {name.lower() for name in common_table_expressions}
+
+    known = set(TABLE_KEYS) | set(MATERIALIZED_VIEWS)
+    if not names or not names <= known:
+        return None
+    return sorted(names)
+
+
+def get_stamp_query(table: str) -> str:
+    if table in TABLE_KEYS:
+        return f'SELECT COUNT(*), MAX("{TABLE_KEYS[table]}") FROM "{table}"'
+    return f'SELECT COUNT(*), NULL FROM "{table}"'
+
+
+def get_version_stamp(conn, tables) -> list:
+    """
+    Returns the row count of every table and the largest value of its key. Counting the rows scans the
+    table, which is still cheap compared to the cached queries. Rows updated in place keep the stamp, which
+    is why load_data clears the cache after every load.
+    """
+
+    stamp = []
+    cur = conn.cursor()
+    for table in tables:
+        cur.execute(get_stamp_query(table))
+        count, max_key = cur.fetchone()
+        stamp.append([table, count, str(max_key)])
+    cur.close()
+    return stamp
+
+
+def get_database_identity(conn, backend: str) -> list:
+    """
+    Returns what identifies the data `conn` reads: the server and database name on Postgres. A DuckDB
+    database is built from the formatted dataset files, so its identity is the database file and the size
+    and modification time of every dataset file.
+    """
+
+    if backend == "psycopg2":
+        parameters = conn.get_dsn_parameters()
+        return [parameters.get("host"), parameters.get("port"), parameters.get("dbname")]
+
+    identity = [os.path.abspath(DuckDBConfig.DATABASE) if DuckDBConfig.DATABASE != ":memory:" else None]
+    for path in get_dataset_paths():
+        if os.path.exists(path):
+            identity.append([os.path.basename(path), *get_file_state(path)[1:]])
+    return identity
+
+
+def get_dataset_paths() -> list:
+    return [
+        os.path.join(DuckDBConfig.DATASET_PATH, file_name)
+        for file_name in sorted([*CSV_NAMES.values(), *PARQUET_NAMES.values()])
+    ]
+
+
+def get_dependencies(pool) -> dict:
+    """
+    Returns what the results of all queries on the database of `pool` (a database.ConnectionPool) depend on,
+    in the form output_cache.py compares without importing this module: the version stamp query and result
+    of every table and view on Postgres, the state of every file a DuckDB database is built from.
+    """
+
+    if pool.backend != "duckdb":
+        stamps = []
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            for table in [*TABLE_KEYS, *MATERIALIZED_VIEWS]:
+                query = get_stamp_query(table)
+                cur.execute(query)
+                stamps.append([query, json.dumps(cur.fetchone(), default=str)])
+            cur.close()
+        return {"files": [], "stamps": stamps}
+
+    paths = [*get_dataset_paths(), SCHEMA_PATH, DERIVED_COLUMNS_PATH, VIEWS_PATH]
+    if DuckDBConfig.DATABASE != ":memory:":
+        paths.append(DuckDBConfig.DATABASE)
+    return {"files": [get_file_state(path) for path in paths], "stamps": []}
+
+
+def get_query_key(conn, query: str, params, reader: str, tables) -> str:
+    backend = type(conn).__module__.split(".")[0]
+    key = {
+        "reader": reader,
+        "backend": backend,
+        "database": get_database_identity(conn, backend),
+        "query": normalize_sql(query),
+        "params": params,
+        "stamp": get_version_stamp(conn, tables),
+    }
+    return hashlib.sha256(json.dumps(key, default=str).encode()).hexdigest()
+
+
+def get_entry_path(key: str) -> str:
+    return os.path.join(CACHE_DIRECTORY, f"{key}.parquet")
+
+
+def evict_entries(max_size: int = MAX_CACHE_SIZE):
+    """
+    Deletes the least recently used entries until all entries together fit into `max_size` bytes. The
+    modification time of an entry is its last use.
+    """
+
+    entries = []
+    for entry in os.scandir(CACHE_DIRECTORY):
+        if entry.name.endswith(".parquet"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+def clear_cache():
+    shutil.rmtree(CACHE_DIRECTORY, ignore_errors=True)
+
+
+# ---------------------------------
+# ---------- QUERY CACHE ----------
+# ---------------------------------
+
+
+def cached_query(
+    conn, query: str, load: Callable[[], pd.DataFrame], reader: str, params=None
+) -> pd.DataFrame:
+    """
+    Returns the DataFrame of a query from the cache, or runs `load` and caches its result as a Parquet file.
+    The key is the database, the normalized SQL, its parameters, the function reading it and a version stamp
+    of every table it touches, so a changed table is queried again. Queries reading anything without a stamp
+    are never cached.
+
+    Args:
+    - conn: Database connection object the query runs on.
+    - query: SQL text of the query.
+    - load: Runs the query and returns its DataFrame.
+    - reader: Name of the function turning the rows into a DataFrame, as it defines the column types.
+    - params: Parameters of the query.
+    """
+
+    tables = get_touched_tables(query)
+    if not USE_QUERY_CACHE or tables is None:
+        tracing.annotate(cache="off")
+        return load()
+
+    path = get_entry_path(get_query_key(conn, query, params, reader, tables))
+    if os.path.exists(path):
+        try:
+            df = pd.read_parquet(path)
+            os.utime(path)
+            tracing.annotate(cache="hit", bytes_read=tracing.get_file_size(path))
+            return df
+        except (OSError, ValueError):
+            # Evicted by another process in the meantime, read from the database
+            pass
+
+    tracing.annotate(cache="miss")
+    df = load()
+
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        df.to_parquet(temporary_path)
+    except (ValueError, TypeError) as error:
+        # Columns pyarrow cannot store (e.g. mixed Python objects) are simply not cached
+        print(f"Query result not cached: {error}")
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        return df
+    os.replace(temporary_path, path)
+    evict_entries()
+    return df
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import shutil
+from typing import List
+
+# ----------------------------
+# ---------- CONFIG ----------
+# ----------------------------
+
+CACHE_DIRECTORY = "./.stage_cache"
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# ---------------------------
+# ---------- UTILS ----------
+# ---------------------------
+
+
+def hash_file(path: str) -> str:
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def get_stage_key(
+    stage_name: str, version: int, input_paths: List[str], options: List[str] = ()
+) -> str:
+    """
+    Returns the cache key of a formatting stage. It changes whenever the content of one of its input files,
+    the version of its transform or one of its options changes.
+
+    Args:
+    - stage_name: Name of the stage.
+    - version: Version of the stage's transform, to be increased whenever its output changes.
+    - input_paths: Files read by the stage.
+    - options: Anything else the output depends on, e.g. the output formats.
+    """
+
+    key = hashlib.sha256(f"{stage_name}:{version}".encode())
+    for path in input_paths:
+        key.update(f"{os.path.basename(path)}:{hash_file(path)}".encode())
+    for option in options:
+        key.update(f"option:{option}".encode())
+    return key.hexdigest()
+
+
+def get_entry_path(stage_name: str, key: str) -> str:
+    return os.path.join(CACHE_DIRECTORY, stage_name, key)
+
+
+# ---------------------------------
+# ---------- STAGE CACHE ----------
+# ---------------------------------
+
+
+def restore_stage(stage_name: str, key: str, file_names: List[str], target_directory: str) -> bool:
+    """
+    Copies the cached outputs of a stage to `target_directory`. Returns False if the stage has to be run.
+    """
+
+    entry_path = get_entry_path(stage_name, key)
+    if not all(os.path.exists(os.path.join(entry_path, name)) for name in file_names):
+        return False
+
+    for name in file_names:
+        shutil.copyfile(os.path.join(entry_path, name), os.path.join(target_directory, name))
+
+    print(f"Restored from cache: {stage_name} ({', '.join(file_names)})")
+    return True
+
+
+def store_stage(stage_name: str, key: str, file_names: List[str], source_directory: str):
+    """
+    Caches the outputs of a finished stage and drops its previous entries. The entry only becomes visible
+    once all of its files are copied, so an interrupted run never leaves a partial entry behind.
+    """
+
+    stage_directory = os.path.join(CACHE_DIRECTORY, stage_name)
+    temporary_path = os.path.join(stage_directory, f".{key}.tmp")
+    os.makedirs(temporary_path, exist_ok=True)
+
+    for name in file_names:
+        shutil.copyfile(os.path.join(source_directory, name), os.path.join(temporary_path, name))
+
+    entry_path = get_entry_path(stage_name, key)
+    shutil.rmtree(entry_path, ignore_errors=True)
+    os.replace(temporary_path, entry_path)
+
+    for entry in os.listdir(stage_directory):
+        if entry != key:
+            shutil.rmtree(os.path.join(stage_directory, entry), ignore_errors=True)
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+import format_csv_files
+import generate_dataset
+
+# Small chunks, so that chunks start at every kind of row (e.g. an athlete born in a year without a date)
+CHUNK_SIZES = [7, 100, 1000]
+
+
+def read_tables(dataset_path: str) -> dict:
+    tables = {}
+    for name, file_name in format_csv_files.CSV_NAMES.items():
+        with open(os.path.join(dataset_path, file_name), "rb") as file:
+            tables[name] = file.read()
+    return tables
+
+
+@pytest.fixture(scope="module")
+def source_directory(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("source"))
+    generate_dataset.main(path, scale_factor=0.005, seed=1)
+    return path
+
+
+@pytest.fixture(scope="module")
+def pipeline_tables(source_directory, tmp_path_factory):
+    working_directory = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("pipeline"))
+    try:
+        format_csv_files.main(mode="pipeline", use_cache=False, source_directory=source_directory)
+        return read_tables(format_csv_files.DATASET_PATH)
+    finally:
+        os.chdir(working_directory)
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_streaming_matches_pipeline(source_directory, pipeline_tables, chunk_size, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    format_csv_files.main(mode="streaming", chunk_size=chunk_size, source_directory=source_directory)
+
+    streamed_tables = read_tables(format_csv_files.DATASET_PATH)
+    for name, content in pipeline_tables.items():
+        assert streamed_tables[name] == content, f"{name} differs with chunks of {chunk_size} rows"
@@ -0,0 +1,271 @@
+import functools
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+# ----------------------------
+# ---------- CONFIG ----------
+# ----------------------------
+
+USE_TRACING = True
+
+# JSON file the spans of a run are written to by `write_trace`
+TRACE_PATH = "./trace.json"
+
+# Whether every query span also gets the plan of EXPLAIN (ANALYZE, BUFFERS). The query runs a second time
+# for it, so the timings of the run are only comparable with this turned off.
+EXPLAIN_QUERIES = False
+
+# Characters of the SQL text kept per query span
+MAX_QUERY_LENGTH = 2000
+
+# Counters of a span that are added to its parent span, so that a stage shows the bytes of all its files
+SUMMED_COUNTERS = ["bytes_read", "bytes_written"]
+
+# Finished spans of this process
+SPANS = []
+SPANS_LOCK = threading.Lock()
+SPAN_IDS = itertools.count(1)
+
+# Open spans of every thread, the last one is the parent of a new span
+OPEN_SPANS = threading.local()
+
+TRACE_START = time.time()
+
+# ---------------------------
+# ---------- UTILS ----------
+# ---------------------------
+
+
+def get_peak_rss_mb():
+    """
+    Returns the most memory the process ever had resident in MB, or None where it is not known.
+    """
+
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return round(psutil.Process().memory_info().peak_wset / 1024**2, 1)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return round(peak / 1024**2 if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def get_file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def get_open_spans() -> list:
+    if not hasattr(OPEN_SPANS, "stack"):
+        OPEN_SPANS.stack = []
+    return OPEN_SPANS.stack
+
+
+# ---------------------------
+# ---------- SPANS ----------
+# ---------------------------
+
+
+@contextmanager
+def span(name: str, kind: str, **attributes):
+    """
+    Records the wall time and the peak RSS of the process of a `with` block as a span of the trace. The
+    block gets the span as a dict and sets its counters on it: rows_in, rows_out, bytes_read and
+    bytes_written. The bytes of a span are added to the span it runs in. A span left by an exception records
+    the error. With `USE_TRACING` turned off the block gets a dict that is thrown away.
+
+    Args:
+    - name: Name of the span, e.g. the function, file or table.
+    - kind: What the span measures, e.g. "stage", "read", "write" or "query".
+    - attributes: Any other values stored with the span.
+    """
+
+    if not USE_TRACING:
+        yield {}
+        return
+
+    stack = get_open_spans()
+    record = {
+        # unique across the worker processes of a run
+        "id": f"{os.getpid()}:{next(SPAN_IDS)}",
+        "parent_id": stack[-1]["id"] if stack else None,
+        "name": name,
+        "kind": kind,
+        "pid": os.getpid(),
+        "thread": threading.current_thread().name,
+        "start": round(time.time() - TRACE_START, 6),
+        **attributes,
+    }
+    stack.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as error:
+        record["error"] = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        record["seconds"] = round(time.perf_counter() - start, 6)
+        record["peak_rss_mb"] = get_peak_rss_mb()
+        stack.pop()
+        if stack:
+            for counter in SUMMED_COUNTERS:
+                if counter in record:
+                    stack[-1][counter] = stack[-1].get(counter, 0) + record[counter]
+        with SPANS_LOCK:
+            SPANS.append(record)
+
+
+def traced(kind: str):
+    """
+    Decorator running every call of a function in a span of `kind` named after the function.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(function.__name__, kind):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def annotate(**attributes):
+    """
+    Stores values with the innermost open span of the current thread, if there is one.
+    """
+
+    stack = get_open_spans() if USE_TRACING else []
+    if stack:
+        stack[-1].update(attributes)
+
+
+# -----------------------------
+# ---------- QUERIES ----------
+# -----------------------------
+
+
+def get_backend(conn) -> str:
+    return type(conn).__module__.split(".")[0]
+
+
+def explain_query(conn, query: str):
+    """
+    Returns the plan of a query with the actual row counts, timings and buffer usage: the JSON plan of
+    EXPLAIN (ANALYZE, BUFFERS) on Postgres, the text of EXPLAIN ANALYZE on DuckDB. Runs the query.
+    """
+
+    query = query.strip().rstrip(";")
+    # a DuckDB cursor is a connection of its own, so the result the query is read from stays open
+    cur = conn.cursor()
+    try:
+        if get_backend(conn) == "psycopg2":
+            cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}")
+            return cur.fetchone()[0]
+        cur.execute(f"EXPLAIN ANALYZE {query}")
+        return "\n".join(row[-1] for row in cur.fetchall())
+    finally:
+        cur.close()
+
+
+@contextmanager
+def query_span(conn, query: str, name: str):
+    """
+    Span of a SQL query with its text and backend. With `EXPLAIN_QUERIES` the plan of the query is added
+    once the span is done, unless the result came from the query cache.
+
+    Args:
+    - conn: Database connection object the query runs on.
+    - query: SQL text of the query.
+    - name: Name of the span, e.g. the function running the query.
+    """
+
+    sql_text = " ".join(query.split())[:MAX_QUERY_LENGTH]
+    with span(name, "query", backend=get_backend(conn), sql=sql_text) as record:
+        yield record
+
+    if USE_TRACING and EXPLAIN_QUERIES and record.get("cache") != "hit" and "error" not in record:
+        try:
+            record["plan"] = explain_query(conn, query)
+        except Exception as error:
+            record["plan"] = f"{type(error).__name__}: {error}"
+
+
+# ---------------------------
+# ---------- TRACE ----------
+# ---------------------------
+
+
+def collect_spans() -> list:
+    """
+    Returns and forgets the spans finished by this process, to send the spans of a worker process back.
+    Spans a forked worker inherited from its parent are left out. Their starts are turned into Unix times,
+    see `add_spans`.
+    """
+
+    with SPANS_LOCK:
+        spans = [
+            {**record, "start": record["start"] + TRACE_START}
+            for record in SPANS
+            if record["pid"] == os.getpid()
+        ]
+        SPANS.clear()
+    return spans
+
+
+def add_spans(spans: list):
+    """
+    Adds spans collected by `collect_spans` in another process, e.g. a worker of a process pool, with their
+    starts relative to the trace of this process.
+    """
+
+    with SPANS_LOCK:
+        SPANS.extend({**record, "start": round(record["start"] - TRACE_START, 6)} for record in spans)
+
+
+def write_trace(path: str = TRACE_PATH) -> Optional[str]:
+    """
+    Writes every finished span as a JSON trace ordered by start time, with the totals of every kind of span.
+    Starts are seconds since the trace started. Returns the path of the trace, or None without spans or with
+    `USE_TRACING` off, in which case nothing is written.
+
+    Args:
+    - path: JSON file of the trace.
+    """
+
+    with SPANS_LOCK:
+        spans = sorted(SPANS, key=lambda record: record["start"])
+    if not USE_TRACING or not spans:
+        return None
+
+    totals = {}
+    for record in spans:
+        total = totals.setdefault(record["kind"], {"spans": 0, "seconds": 0.0})
+        total["spans"] += 1
+        total["seconds"] = round(total["seconds"] + record["seconds"], 6)
+
+    trace = {
+        "started": datetime.fromtimestamp(TRACE_START, timezone.utc).isoformat(timespec="seconds"),
+        "command": " ".join(sys.argv),
+        "totals": totals,
+        "spans": spans,
+    }
+    with open(path, "w") as file:
+        json.dump(trace, file, indent=2, default=str)
+    print(f"Trace of {len(spans)} spans written to '{path}'")
+    return path